@@ -1,13 +1,17 @@
-from flask import Flask, request, jsonify
-from langchain_google_genai import ChatGoogleGenerativeAI
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 load_dotenv()
 import json
-from services.gemini_agent import get_agent
-from sarvamai import SarvamAI
-import tempfile
+from services.gemini_agent import get_planner_llm, prefetch_trip_data, iter_prefetch_trip_data
+from services.trip_planner import (
+    TripExtractionError, extract_trip_details, build_trip_prompt, generate_itinerary, resolve_planner_mode
+)
+from services.cache import response_cache
+from services.itinerary_cache import get_cached_itinerary, itinerary_cache, store_itinerary
+from services.voice_service import spool_upload, transcribe_recording
+from services import circuit_breaker, metrics, quota, single_flight, startup
 
 SARVAM_API_KEY = os.getenv("STT_API_KEY")
 if not SARVAM_API_KEY:
@@ -19,14 +23,33 @@ if not GOOGLE_API_KEY:
 
 # Set it in environment (for services that might need it)
 os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
-sarvam_client = SarvamAI(api_subscription_key=SARVAM_API_KEY)
 app = Flask(__name__)
 CORS(app)
+startup.start()
 @app.route('/')
 def home():
     return jsonify({"message": "AI Travel Planner API is running "})
 
 
+@app.route("/cache/stats")
+def cache_stats():
+    """
+    Hit/miss counters of the provider response and itinerary caches, coalesced (single-flight)
+    lookups, quota use and the state of each provider's circuit breaker
+    """
+    return jsonify({
+        **response_cache.stats(), **single_flight.stats(),
+        "itinerary": itinerary_cache.stats(), "quota": quota.quota_manager.usage(),
+        "circuits": circuit_breaker.stats(),
+    })
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Stage, upstream and LLM latency histograms and token counts in the Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/voice", methods=["POST"])
 def voice_to_text():
     """Convert voice audio to text using Sarvam AI"""
@@ -39,30 +62,16 @@ def voice_to_text():
     if audio.filename == "":
         return jsonify({"error": "Empty audio file"}), 400
 
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".webm")
+    # Buffered in memory (spilling to disk only for very large uploads) and sent straight to Sarvam
+    buffer = spool_upload(audio.stream)
 
     try:
-        audio.save(tmp.name)
-        tmp.close()
-
-        with open(tmp.name, "rb") as f:
-            response = sarvam_client.speech_to_text.translate(
-                file=f,
-                model="saaras:v2.5"
-            )
-
-        # Check if response has transcript
-        if hasattr(response, 'transcript') and response.transcript:
-            return jsonify({
-                "text": response.transcript,
-                "status": "success"
-            }), 200
-        else:
-            # Response might have different structure
-            return jsonify({
-                "text": str(response),
-                "status": "success"
-            }), 200
+        text = transcribe_recording(buffer, audio.filename, audio.mimetype)
+
+        return jsonify({
+            "text": text,
+            "status": "success"
+        }), 200
 
     except Exception as e:
         print(f"[ERROR] Voice-to-text failed: {str(e)}")
@@ -72,12 +81,7 @@ def voice_to_text():
         }), 500
 
     finally:
-        # Clean up temporary file
-        try:
-            if os.path.exists(tmp.name):
-                os.remove(tmp.name)
-        except Exception as e:
-            print(f"[WARNING] Could not delete temp file: {str(e)}")
+        buffer.close()
 
 # @app.route("/chat", methods=["POST"])
 # def chat():
@@ -139,212 +143,131 @@ def voice_to_text():
 #             "error_details": str(e)
 #         }), 200
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def wants_timings(data):
+    """True if the client asked for a per-stage timing breakdown in the /chat response"""
+    return bool(data.get("timings")) or request.args.get("timings") in ("1", "true")
+
+
+def bypass_cache(data):
+    """True if the client asked for a freshly generated itinerary"""
+    return bool(data.get("bypass_cache")) or "no-cache" in request.headers.get("Cache-Control", "")
+
+
+def stream_chat_response(message, bypass=False):
+    """
+    Server-Sent Events version of /chat: reports extraction and each tool as it finishes,
+    then streams the itinerary tokens as the LLM generates them.
+    A cached itinerary is sent as a single token event.
+    """
+    @stream_with_context
+    def generate():
+        # Collects the request's failed provider calls, which keep its itinerary out of the cache
+        with metrics.request_timings():
+            yield from _stream_chat_events(message, bypass)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _stream_chat_events(message, bypass):
+    """The events of stream_chat_response"""
+    yield sse_event("status", {"stage": "extracting"})
+    try:
+        details = extract_trip_details(message)
+    except TripExtractionError as e:
+        yield sse_event("error", {"error": f"Invalid JSON: {str(e)}", "raw_output": e.raw_output})
+        return
+    yield sse_event("details", details)
+
+    cached_reply = None if bypass else get_cached_itinerary(details, "single_pass")
+    if cached_reply:
+        yield sse_event("token", {"text": cached_reply})
+        yield sse_event("done", {"cached": True})
+        return
+
+    prefetched = {}
+    for name, result in iter_prefetch_trip_data(
+        details.get("from_city"), details.get("to_city"), details.get("start_date"),
+        details.get("end_date"), details.get("adults"), details.get("budget"),
+    ):
+        prefetched[name] = result
+        yield sse_event("tool", {"name": name, "status": "done"})
+
+    yield sse_event("status", {"stage": "planning"})
+    parts = []
+    try:
+        for chunk in get_planner_llm().stream(build_trip_prompt(details, prefetched, for_agent=False)):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield sse_event("token", {"text": chunk.content})
+    except Exception as e:
+        yield sse_event("error", {"error": f"Itinerary generation failed: {str(e)}"})
+        return
+    store_itinerary(details, "single_pass", "".join(parts), prefetched)
+    yield sse_event("done", {"cached": False})
+
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    data = request.get_json()
+    return stream_chat_response(data.get("message", ""), bypass_cache(data))
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
     data = request.get_json()
     message = data.get("message", "")
 
-    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2)
-
-    extraction_prompt = f"""
-    Extract the following details from this message:
-    - from_city
-    - to_city
-    - start_date (Date of tomorrow if not mentioned, format: YYYY-MM-DD)
-    - end_date (format: YYYY-MM-DD)
-    - adults (default 2 if not mentioned)
-    - budget (default 10000 if not mentioned)
-
-    Message: "{message}"
-    **Date Handling Rules (VERY IMPORTANT):**
-    - If the user does **not specify dates**, assume the trip starts **from tomorrow**.
-    - If the user mentions trip duration (like "3 days" or "5-day trip"), calculate `end_date` accordingly.
-    -Output all dates in `YYYY-MM-DD` format.
-    
-    Respond in pure JSON like this:
-    {{
-      "from_city": "...",
-      "to_city": "...",
-      "start_date": "YYYY-MM-DD",
-      "end_date": "YYYY-MM-DD",
-      "adults": ,
-      "budget": 
-    }}
-    """
+    # Opt-in streaming for clients that ask for an event stream
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return stream_chat_response(message, bypass_cache(data))
 
-    extraction_response = llm.invoke(extraction_prompt)
-    raw_output = extraction_response.content.strip()
+    with metrics.request_timings() as timings:
+        with metrics.span("chat"):
+            body, status = plan_chat(data, message)
+    if wants_timings(data):
+        body["timings"] = timings.breakdown()
+    return jsonify(body), status
 
-    # Handle code block formatting
-    if raw_output.startswith("```"):
-        raw_output = raw_output.strip("`")
-        if raw_output.lower().startswith("json"):
-            raw_output = raw_output[4:]
-        raw_output = raw_output.strip()
 
+def plan_chat(data, message):
+    """The /chat reply as (JSON body, status code)"""
     try:
-        details = json.loads(raw_output)
-    except json.JSONDecodeError as e:
-        print("Invalid JSON output:", raw_output)
-        return jsonify({"error": f"Invalid JSON: {str(e)}", "raw_output": raw_output}), 500
-
-    from_city = details.get("from_city")
-    to_city = details.get("to_city")
-    start_date = details.get("start_date")
-    end_date = details.get("end_date")
-    adults = details.get("adults")
-    budget = details.get("budget")
-
-    # Create agent with the extracted parameters
-    agent = get_agent(from_city, to_city, start_date, end_date, adults)
-
-    prompt = f"""
-You are a trip-mitra an expert travel planner creating a complete itinerary from {from_city} to {to_city}.
-
-Trip Details:
-- Travel Dates: {start_date} to {end_date}
-- Travelers: {adults} adults
-- Budget: ₹{budget}
-
-IMPORTANT INSTRUCTIONS:
-1. You have access to these tools: get_trains, get_flights, get_hotels, get_weather_forecast
-2. Call each tool ONLY ONCE with input "fetch"
-3. After collecting data from all tools, immediately provide your Final Answer
-4. DO NOT ask follow-up questions or try to use tools again
-5. If a tool fails, note it and continue with other tools
-YOUR TASK: Create a comprehensive travel plan with the following sections:
-
-
-TRANSPORTATION :
-### Trains:
-- Use the tool: get_trains (input: "fetch")
-- This returns BOTH outbound and return journey trains in one call
-- From the results, recommend:
-  * Top 3 trains for outbound journey ({from_city} → {to_city} on {start_date})
-  * Top 3 trains for return journey ({to_city} → {from_city} on {end_date})
-- Selection criteria: Prefer overnight trains (saves daytime for activities), shorter duration, good class availability
-- For each train provide: Name, Number, Departure time, Arrival time, Duration, Available classes
-- If tool fails: Display "Train data unavailable due to API limit" and continue with other sections
-
-### Flights:(Call only if budget is >10,000)
-- Use the tool: get_flights (input: "fetch")
-- This returns flights for complete round trip
-- From the results, recommend:
-  * Top 3 flight options considering both outbound and return
-- Selection criteria: Lowest total cost, minimum stops, convenient timings
-- For each flight provide: Airline name, Flight code(if available), Departure time, Arrival time, Total cost, Class.
--DO NOT write 'Not available' - if data is missing from API, skip that flight information.
-- If tool fails: Display "Flight data unavailable due to API limit" and continue with other sections
-
-
-ACCOMMODATION :
-
-- Use the tool: get_hotels (input: "fetch")
-- This returns all available hotels in {to_city}
-- From the results, recommend TOP 3 hotels based on:
-  * Budget-friendly (fits within ₹{budget} for {adults} people)
-  * High ratings and positive reviews
-  * Strategic location (close to most attractions in your itinerary - compare latitude/longitude)
-  * Good cleanliness and service ratings
-- For each hotel provide:
-  * Hotel name
-  * Brief description (2-3 sentences)
-  * Price per night (approximate)
-  * Nearby landmark (e.g., "500m from Kashi Vishwanath Temple")
-  * Photo link (from the API response)
-- If tool fails: Display "Hotel data unavailable due to API limit" and continue with other sections
-
-
-DAY-WISE ITINERARY:
-
-For each day of the trip, create a detailed plan:
-
-### Day X Format:
-**Weather:** [Insert weather info here - see weather guidelines below]
-
-**Morning (6 AM - 12 PM):**
-- Place 1: [Name] ([Time needed], [Timings: e.g., 8 AM - 10 AM])
-- Place 2: [Name] ([Time needed], [Timings])
-
-**Afternoon (12 PM - 5 PM):**
-- Place 3: [Name] ([Time needed], [Timings])
-- Lunch recommendation
-
-**Evening (5 PM - 9 PM):**
-- Place 4: [Name] ([Time needed], [Timings])
-- Dinner recommendation
-
-**Local Transportation for the day:**
-[Suggest best local transport options: auto, cab, metro, bus, walking, etc.]
-
-### Weather Guidelines:
-- Use the tool: get_weather_forecast (input: "fetch") - CALL ONLY ONCE for entire trip
-- **Day 1:** Provide complete weather summary
-  * Temperature range (e.g., "22°C to 30°C")
-  * Humidity level
-  * Rain probability
-  * For hill stations ONLY: Sunrise and sunset times
-  * Example: "Pleasant weather with temperatures between 22-30°C, low humidity (40%), no rain expected"
-- **Day 2 onwards:**
-  * If weather is same/similar: Write "Weather similar to Day 1"
-  * If weather changes significantly: Mention only the changes (e.g., "Light rain expected in afternoon, carry umbrella")
-- **IMPORTANT:** Add weather info WITHIN each day's section, NOT as a separate section
-- If tool fails: Display "Weather data unavailable due to API limit" and continue
-
-
-PACKING LIST:
-
-Create a practical packing checklist based on:
-- Weather conditions during travel dates
-- Activities planned in the itinerary
-- Duration of trip
-- Type of destinations (urban, hill station, beach, religious, etc.)
-
-Group items into categories: Clothing, Documents, Toiletries, Electronics, Medicines, Miscellaneous
-
-
-
-## SECTION 5: ESTIMATED COST BREAKDOWN
-
-Provide a detailed budget breakdown:
-- Train/Flight tickets (both ways): ₹____
-- Accommodation (per night × nights): ₹____
-- Local transportation (daily estimate × days): ₹____
-- Food (breakfast, lunch, dinner × days): ₹____
-- Entry fees for attractions: ₹____
-- Shopping/Miscellaneous (10-15% buffer): ₹____
-**TOTAL ESTIMATED COST:** ₹____
-
-Compare with budget: ₹{budget}
-[Mention if within budget or suggest adjustments]
-
-
-
-FORMATTING REQUIREMENTS:
-✓ Use markdown formatting for clear readability
-✓ Use headers (##, ###), bullet points, and bold text appropriately
-✓ Keep descriptions concise - no unnecessary verbosity
-✓ If ANY tool fails, continue creating the itinerary with available data
-✓ NEVER stop execution midway - always deliver a complete plan
-
-CRITICAL RULE: Even if 1 or 2 tools fail, you MUST still generate a complete itinerary using whatever data is available. A partial plan is better than no plan.
-COMPLETION CHECKLIST (for your internal use):
-□ Called get_trains (or noted failure)
-□ Called get_flights (or noted failure)  
-□ Called get_hotels (or noted failure)
-□ Called get_weather_forecast (or noted failure)
-□ Created day-wise itinerary
-□ Added packing list
-□ Added cost breakdown
+        mode = resolve_planner_mode(data.get("mode"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
-Once you have completed the above checklist, immediately provide your Final Answer with the complete itinerary in markdown format. Do not ask for more information or try to use tools again.
+    try:
+        details = extract_trip_details(message)
+    except TripExtractionError as e:
+        return {"error": f"Invalid JSON: {str(e)}", "raw_output": e.raw_output}, 500
+
+    # Repeat (and near-repeat) trips are answered from the itinerary cache unless the client opts out
+    if not bypass_cache(data):
+        cached_reply = get_cached_itinerary(details, mode)
+        if cached_reply:
+            return {"reply": cached_reply, "mode": mode, "cached": True}, 200
+
+    # Fetch all tool data concurrently, then hand it to the planner with the extracted parameters
+    with metrics.span("prefetch"):
+        prefetched = prefetch_trip_data(
+            details.get("from_city"), details.get("to_city"), details.get("start_date"),
+            details.get("end_date"), details.get("adults"), details.get("budget"),
+        )
 
-"""
     try:
-        response = agent.run(prompt)
-        return jsonify({"reply": response})
+        response = generate_itinerary(details, prefetched, mode)
+        store_itinerary(details, mode, response, prefetched)
+        return {"reply": response, "mode": mode, "cached": False}, 200
     except Exception as e:
-        return jsonify({"error": f"Agent execution failed: {str(e)}"}), 500
+        return {"error": f"Agent execution failed: {str(e)}"}, 500
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+"""
+ASGI version of the /chat and /voice routes, built on the async service layer.
+Run from the backend directory with:  uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import contextlib
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from services import http_client, metrics, startup
+from services.gemini_agent import async_prefetch_trip_data
+from services.itinerary_cache import get_cached_itinerary, store_itinerary
+from services.trip_planner import (
+    TripExtractionError, aextract_trip_details, agenerate_itinerary, resolve_planner_mode
+)
+from services.voice_service import transcribe_recording
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+if not GOOGLE_API_KEY:
+    raise ValueError("GOOGLE_API_KEY not found in .env file")
+
+
+async def home(request):
+    return JSONResponse({"message": "AI Travel Planner API is running "})
+
+
+async def voice_to_text(request):
+    """Convert voice audio to text using Sarvam AI"""
+    form = await request.form()
+    audio = form.get("audio")
+
+    if audio is None or isinstance(audio, str):
+        return JSONResponse({"error": "No audio file provided"}, status_code=400)
+    if audio.filename == "":
+        return JSONResponse({"error": "Empty audio file"}, status_code=400)
+
+    try:
+        # Starlette already spools the upload (in memory up to 1 MB); the Sarvam SDK is synchronous
+        text = await asyncio.to_thread(transcribe_recording, audio.file, audio.filename, audio.content_type)
+        return JSONResponse({"text": text, "status": "success"})
+    except Exception as e:
+        print(f"[ERROR] Voice-to-text failed: {str(e)}")
+        return JSONResponse({
+            "error": "Failed to transcribe audio",
+            "details": str(e)
+        }, status_code=500)
+
+
+async def prometheus_metrics(request):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def chat(request):
+    data = await request.json()
+
+    with metrics.request_timings() as timings:
+        with metrics.span("chat"):
+            body, status = await plan_chat(request, data)
+    if data.get("timings") or request.query_params.get("timings") in ("1", "true"):
+        body["timings"] = timings.breakdown()
+    return JSONResponse(body, status_code=status)
+
+
+async def plan_chat(request, data):
+    """The /chat reply as (JSON body, status code)"""
+    message = data.get("message", "")
+
+    try:
+        mode = resolve_planner_mode(data.get("mode"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        details = await aextract_trip_details(message)
+    except TripExtractionError as e:
+        return {"error": f"Invalid JSON: {str(e)}", "raw_output": e.raw_output}, 500
+
+    bypass = bool(data.get("bypass_cache")) or "no-cache" in request.headers.get("cache-control", "")
+    if not bypass:
+        cached_reply = await asyncio.to_thread(get_cached_itinerary, details, mode)
+        if cached_reply:
+            return {"reply": cached_reply, "mode": mode, "cached": True}, 200
+
+    with metrics.span("prefetch"):
+        prefetched = await async_prefetch_trip_data(
+            details.get("from_city"), details.get("to_city"), details.get("start_date"),
+            details.get("end_date"), details.get("adults"), details.get("budget"),
+        )
+
+    try:
+        response = await agenerate_itinerary(details, prefetched, mode)
+        await asyncio.to_thread(store_itinerary, details, mode, response, prefetched)
+        return {"reply": response, "mode": mode, "cached": False}, 200
+    except Exception as e:
+        return {"error": f"Agent execution failed: {str(e)}"}, 500
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    startup.start()
+    yield
+    await http_client.aclose_async_client()
+
+
+app = Starlette(
+    routes=[
+        Route("/", home),
+        Route("/voice", voice_to_text, methods=["POST"]),
+        Route("/chat", chat, methods=["POST"]),
+        Route("/metrics", prometheus_metrics),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
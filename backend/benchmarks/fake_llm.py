@@ -0,0 +1,117 @@
+"""
+Deterministic stand-in for ChatGoogleGenerativeAI. Install it with
+llm_registry.set_llm_factory(FakeLLMFactory(...)) before the app builds any model.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+try:
+    from services.trip_parser import parse_trip_message
+except ImportError:
+    from trip_parser import parse_trip_message
+
+_ITINERARY_SECTIONS = (
+    "Trip Overview", "How to Reach", "Day-wise Plan", "Hotels", "What to Pack", "Total Budget Summary",
+)
+
+
+def fake_itinerary(words=400):
+    """A markdown itinerary of roughly `words` words, the same every time"""
+    per_section = max(words // len(_ITINERARY_SECTIONS), 1)
+    sections = []
+    for title in _ITINERARY_SECTIONS:
+        body = " ".join(f"{title.split()[0].lower()}-{i}" for i in range(per_section))
+        sections.append(f"## {title}\n{body}\n")
+    return "\n".join(sections)
+
+
+def fake_reply(prompt, itinerary_words=400):
+    """What the fake model answers to each kind of prompt the app sends"""
+    if "Extract the following details" in prompt:
+        message = prompt.split('Message: "', 1)[-1].split('"', 1)[0]
+        details, _ = parse_trip_message(message)
+        return json.dumps(details)
+    if "IATA airport code" in prompt:
+        return "DEL"
+    if "IRCTC station code" in prompt:
+        return "NDLS"
+    if "Final Answer" in prompt:
+        # ReAct agent: finish in one step, as the prefetched data is already in the prompt
+        return f"Thought: I have all the data I need.\nFinal Answer: {fake_itinerary(itinerary_words)}"
+    return fake_itinerary(itinerary_words)
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers after `latency` seconds; streams the answer in `stream_chunks` pieces"""
+
+    model: str = "fake"
+    latency: float = 0.0
+    itinerary_words: int = 400
+    stream_chunks: int = 20
+    stats: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.model}
+
+    def _record(self, prompt, reply):
+        if self.stats is not None:
+            self.stats.record(self.model, prompt, reply)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        prompt = messages[-1].content
+        time.sleep(self.latency)
+        reply = fake_reply(prompt, self.itinerary_words)
+        self._record(prompt, reply)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        prompt = messages[-1].content
+        reply = fake_reply(prompt, self.itinerary_words)
+        self._record(prompt, reply)
+        size = max(len(reply) // self.stream_chunks, 1)
+        for start in range(0, len(reply), size):
+            time.sleep(self.latency / self.stream_chunks)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=reply[start:start + size]))
+
+
+class FakeLLMStats:
+    """Calls and (whitespace-separated) prompt/completion words per model"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, model, prompt, reply):
+        with self._lock:
+            self.counts[f"{model}.calls"] += 1
+            self.counts[f"{model}.prompt_words"] += len(prompt.split())
+            self.counts[f"{model}.completion_words"] += len(reply.split())
+
+
+class FakeLLMFactory:
+    """llm_registry factory building FakeChatModels that share one FakeLLMStats"""
+
+    def __init__(self, latency=0.0, itinerary_words=400):
+        self.latency = latency
+        self.itinerary_words = itinerary_words
+        self.stats = FakeLLMStats()
+
+    def __call__(self, model, **options):
+        return FakeChatModel(
+            model=model, latency=self.latency, itinerary_words=self.itinerary_words, stats=self.stats,
+            callbacks=options.get("callbacks"),
+        )
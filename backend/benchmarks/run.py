@@ -0,0 +1,191 @@
+"""
+Offline benchmark of /chat and /voice: every provider is served by a local ProviderStub and
+every Gemini model by a FakeChatModel, so runs cost no quota and are repeatable.
+
+    cd backend && python -m benchmarks.run --requests 50 --concurrency 8 --latency 0.2
+
+Reports latency percentiles, throughput, errors, upstream calls per provider endpoint and
+fake LLM calls. Add --json for machine-readable output (e.g. to diff against a baseline).
+"""
+import argparse
+import io
+import json
+import math
+import os
+import sys
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.stubs import ProviderStub  # noqa: E402
+
+TRIP_MESSAGES = (
+    "Plan a trip from Delhi to Goa from {start} to {end} for 2 adults, budget {budget} rupees",
+    "I want to go from Mumbai to Jaipur from {start} to {end}, 3 adults, budget {budget} rupees",
+    "Trip from Bangalore to Manali from {start} to {end} for 2 adults with a budget of {budget} rupees",
+)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(latencies, elapsed, errors):
+    count = len(latencies) + errors
+    return {
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "max_ms": _ms(max(latencies) if latencies else None),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def trip_message(i, unique):
+    from datetime import date, timedelta
+
+    # Dates inside the weather horizon; --unique varies the budget so no two trips share a cache entry
+    start = date.today() + timedelta(days=3)
+    end = start + timedelta(days=3)
+    budget = 30000 + (i * 5000 if unique else (i % len(TRIP_MESSAGES)) * 5000)
+    template = TRIP_MESSAGES[i % len(TRIP_MESSAGES)]
+    return template.format(start=start.strftime("%d %B %Y"), end=end.strftime("%d %B %Y"), budget=budget)
+
+
+def silent_wav(seconds=1.0, rate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def drive(requests, concurrency, send):
+    """Runs send(i) for i in range(requests) on `concurrency` threads; returns (latencies, elapsed, errors)"""
+    latencies = []
+    errors = 0
+
+    def timed(i):
+        started = time.perf_counter()
+        ok = send(i)
+        return ok, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, latency in pool.map(timed, range(requests)):
+            if ok:
+                latencies.append(latency)
+            else:
+                errors += 1
+    return latencies, time.perf_counter() - started, errors
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline /chat and /voice benchmark")
+    parser.add_argument("--requests", type=int, default=20, help="/chat requests to send")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--latency", type=float, default=0.05, help="provider stub latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random provider latency, up to (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of provider calls failing with 503")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="fake LLM latency per call (s)")
+    parser.add_argument("--voice-requests", type=int, default=0, help="/voice requests to send")
+    parser.add_argument("--mode", choices=("agent", "single_pass"), default=None, help="planner mode")
+    parser.add_argument("--unique", action="store_true", help="make every trip distinct (no itinerary cache hits)")
+    parser.add_argument("--bypass-cache", action="store_true", help="send bypass_cache with every /chat request")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the stub's latency/error randomness")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def run(args):
+    stub = ProviderStub(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed).start()
+
+    # The services read their settings at import time, so the environment goes in before the app is imported
+    os.environ.update(stub.environment())
+    for key in ("GOOGLE_API_KEY", "STT_API_KEY", "HOTELS_API_KEY", "Flight_API_KEY", "IRCTC_API_KEY"):
+        os.environ.setdefault(key, "benchmark")
+    # Memory-only caches and quotas so runs don't read (or pollute) the on-disk state
+    os.environ["CACHE_DB_PATH"] = ""
+    os.environ["QUOTA_DB_PATH"] = ""
+
+    from benchmarks.fake_llm import FakeLLMFactory
+    from services.llm_registry import set_llm_factory
+
+    llm = FakeLLMFactory(latency=args.llm_latency)
+    set_llm_factory(llm)
+
+    from app import app
+
+    def send_chat(i):
+        payload = {"message": trip_message(i, args.unique), "bypass_cache": args.bypass_cache}
+        if args.mode:
+            payload["mode"] = args.mode
+        response = app.test_client().post("/chat", json=payload)
+        return response.status_code == 200
+
+    audio = silent_wav()
+
+    def send_voice(i):
+        data = {"audio": (io.BytesIO(audio), "recording.wav", "audio/wav")}
+        response = app.test_client().post("/voice", data=data, content_type="multipart/form-data")
+        return response.status_code == 200
+
+    report = {"config": vars(args).copy()}
+    try:
+        if args.requests:
+            report["chat"] = summarize(*drive(args.requests, args.concurrency, send_chat))
+        if args.voice_requests:
+            report["voice"] = summarize(*drive(args.voice_requests, args.concurrency, send_voice))
+    finally:
+        stub.stop()
+
+    report["upstream_calls"] = dict(sorted(stub.calls.items()))
+    report["llm"] = dict(sorted(llm.stats.counts.items()))
+    return report
+
+
+def print_report(report):
+    for route in ("chat", "voice"):
+        if route not in report:
+            continue
+        r = report[route]
+        print(f"/{route}: {r['requests']} requests, {r['errors']} errors, {r['throughput_rps']} req/s")
+        print(f"  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms  "
+              f"mean {r['mean_ms']} ms  max {r['max_ms']} ms")
+    print("upstream calls:")
+    for endpoint, count in report["upstream_calls"].items():
+        print(f"  {endpoint:32} {count}")
+    print("llm:")
+    for stat, count in report["llm"].items():
+        print(f"  {stat:32} {count}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
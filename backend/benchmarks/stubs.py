@@ -0,0 +1,150 @@
+"""
+Local stand-in for the provider APIs the services call (Booking.com hotels/flights, IRCTC,
+Google Places and Weather, Sarvam STT), serving recorded payloads from benchmarks/payloads
+with configurable latency and error injection.
+"""
+import copy
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+
+# Request path -> (endpoint name used in the call counts, payload file)
+ROUTES = {
+    "/api/v1/hotels/searchDestination": ("hotels.destination", "hotels_destination.json"),
+    "/api/v1/hotels/searchHotels": ("hotels.search", "hotels_search.json"),
+    "/api/v1/flights/searchFlights": ("flights.search", "flights_search.json"),
+    "/api/v3/trainBetweenStations": ("trains.between_stations", "trains.json"),
+    "/maps/api/place/textsearch/json": ("places.text_search", "places.json"),
+    "/v1/forecast/days:lookup": ("weather.forecast", "weather.json"),
+    "/speech-to-text-translate": ("sarvam.speech_to_text", "speech_to_text.json"),
+}
+
+
+def load_payloads():
+    payloads = {}
+    for endpoint, filename in ROUTES.values():
+        with open(os.path.join(PAYLOAD_DIR, filename), encoding="utf-8") as f:
+            payloads[endpoint] = json.load(f)
+    return payloads
+
+
+def _current_forecast(payload):
+    # Recorded forecasts are re-dated to start today, like the live endpoint
+    forecast = copy.deepcopy(payload)
+    for offset, day in enumerate(forecast["forecastDays"]):
+        current = date.today() + timedelta(days=offset)
+        day["displayDate"] = {"year": current.year, "month": current.month, "day": current.day}
+        for event in ("sunriseTime", "sunsetTime"):
+            day["sunEvents"][event] = current.isoformat() + day["sunEvents"][event][10:]
+    return forecast
+
+
+class ProviderStub:
+    """
+    Threaded HTTP server answering every provider route on one port.
+    Each request waits `latency` seconds plus up to `jitter` more, and fails with a 503
+    with probability `error_rate`. Calls (and injected errors) are counted per endpoint.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._payloads = load_payloads()
+        self._forecast = None
+        self._forecast_day = None
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                status, body = stub.handle(urlparse(self.path).path)
+                data = json.dumps(body).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up, e.g. a hedged request whose other copy answered first
+                    self.close_connection = True
+
+            do_GET = _respond
+            do_POST = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle(self, path):
+        """Returns (status, JSON body) for a request path"""
+        route = ROUTES.get(path)
+        if route is None:
+            return 404, {"message": f"No stub for {path}"}
+        endpoint = route[0]
+
+        with self._lock:
+            self.calls[endpoint] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.calls[f"{endpoint}.errors"] += 1
+        time.sleep(delay)
+        if failed:
+            return 503, {"message": "Injected failure"}
+        if endpoint == "weather.forecast":
+            return 200, self._today_forecast()
+        return 200, self._payloads[endpoint]
+
+    def _today_forecast(self):
+        with self._lock:
+            if self._forecast_day != date.today():
+                self._forecast = _current_forecast(self._payloads["weather.forecast"])
+                self._forecast_day = date.today()
+            return self._forecast
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="provider-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def environment(self):
+        """Environment variables that point every service at this stub"""
+        return {
+            "BOOKING_API_BASE_URL": self.base_url,
+            "IRCTC_API_BASE_URL": self.base_url,
+            "PLACES_API_BASE_URL": self.base_url,
+            "WEATHER_API_BASE_URL": self.base_url,
+            "SARVAM_API_BASE_URL": self.base_url,
+        }
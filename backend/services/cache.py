@@ -0,0 +1,222 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Shared by every worker process on the host; set CACHE_DB_PATH="" to keep the cache in memory only
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(tempfile.gettempdir(), "trip_mitra_cache.sqlite3"))
+CACHE_MEMORY_ITEMS = int(os.getenv("CACHE_MEMORY_ITEMS", "512"))
+# Expired rows are deleted from the SQLite file on startup and after every this many writes
+CACHE_PURGE_EVERY = int(os.getenv("CACHE_PURGE_EVERY", "500"))
+
+# Seconds each kind of provider data stays fresh
+CACHE_TTLS = {
+    "weather": int(os.getenv("CACHE_TTL_WEATHER", str(3 * 3600))),
+    "trains": int(os.getenv("CACHE_TTL_TRAINS", str(24 * 3600))),
+    "flights": int(os.getenv("CACHE_TTL_FLIGHTS", str(30 * 60))),
+    "hotels": int(os.getenv("CACHE_TTL_HOTELS", str(15 * 60))),
+    "places": int(os.getenv("CACHE_TTL_PLACES", str(7 * 24 * 3600))),
+    # City coordinates don't change; keep them for ~10 years
+    "geocode": int(os.getenv("CACHE_TTL_GEOCODE", str(10 * 365 * 24 * 3600))),
+}
+# A generated itinerary is only as fresh as the provider data it was written from
+CACHE_TTLS["itinerary"] = int(os.getenv(
+    "CACHE_TTL_ITINERARY",
+    str(min(CACHE_TTLS[kind] for kind in ("weather", "trains", "flights", "hotels"))),
+))
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.strip().lower().split())
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def make_key(endpoint, *args, **kwargs):
+    """
+    Stable key for an endpoint plus its parameters; case and whitespace in strings don't matter.
+    """
+    payload = json.dumps([endpoint, _normalize(args), _normalize(kwargs)], sort_keys=True)
+    return f"{endpoint}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class ResponseCache:
+    """
+    Two-tier TTL cache: an in-process LRU in front of a SQLite file shared between processes.
+    The memory tier holds at most `max_items` entries and, if `max_bytes` is set, at most that
+    many bytes of (JSON-encoded) values. Values must be JSON-serializable. Values returned from
+    the memory tier are shared between callers, so treat them as read-only.
+    """
+
+    def __init__(self, db_path=CACHE_DB_PATH, max_items=CACHE_MEMORY_ITEMS, max_bytes=None,
+                 purge_every=CACHE_PURGE_EVERY):
+        self.db_path = db_path
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.purge_every = purge_every
+        self._writes = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = Counter()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, kind TEXT, value TEXT, expires_at REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+            self.purge_expired()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _forget(self, key):
+        # Caller holds self._lock
+        entry = self._memory.pop(key, None)
+        if entry:
+            self._memory_bytes -= entry[2]
+
+    def _remember(self, key, value, expires_at, size=0):
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            self._forget(key)
+            self._memory[key] = (expires_at, value, size)
+            self._memory_bytes += size
+            while len(self._memory) > self.max_items or (self.max_bytes and self._memory_bytes > self.max_bytes):
+                self._forget(next(iter(self._memory)))
+
+    def get(self, key, kind="default"):
+        """
+        Returns (hit, value).
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self._stats[f"{kind}.memory_hits"] += 1
+                return True, entry[1]
+            if entry:
+                self._forget(key)
+
+        if self.db_path:
+            try:
+                row = self._connect().execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"[WARNING] Cache read failed: {e}")
+                row = None
+            if row:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1], len(row[0]) if self.max_bytes else 0)
+                with self._lock:
+                    self._stats[f"{kind}.disk_hits"] += 1
+                return True, value
+
+        with self._lock:
+            self._stats[f"{kind}.misses"] += 1
+        return False, None
+
+    def set(self, key, value, ttl, kind="default"):
+        expires_at = time.time() + ttl
+        encoded = json.dumps(value) if self.db_path or self.max_bytes else None
+        self._remember(key, value, expires_at, len(encoded) if self.max_bytes else 0)
+        if self.db_path:
+            try:
+                self._connect().execute(
+                    "INSERT OR REPLACE INTO responses (key, kind, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, kind, encoded, expires_at),
+                )
+            except sqlite3.Error as e:
+                print(f"[WARNING] Cache write failed: {e}")
+            with self._lock:
+                self._writes += 1
+                purge = bool(self.purge_every) and self._writes % self.purge_every == 0
+            if purge:
+                self.purge_expired()
+
+    def purge_expired(self):
+        """Deletes expired rows from the SQLite file (every process's), returning how many went"""
+        if not self.db_path:
+            return 0
+        try:
+            deleted = self._connect().execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+        except sqlite3.Error as e:
+            print(f"[WARNING] Cache purge failed: {e}")
+            return 0
+        with self._lock:
+            self._stats["purged"] += deleted
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._memory)
+            if self.max_bytes:
+                stats["memory_bytes"] = self._memory_bytes
+        return stats
+
+
+response_cache = ResponseCache()
+
+
+def cached(kind, should_cache=bool, endpoint=None):
+    """
+    Caches a service function's result under its name plus normalized arguments for CACHE_TTLS[kind].
+    Results failing `should_cache` (by default: empty/None, i.e. failed lookups) are not stored.
+    Works on coroutine functions too; pass the sync function's `endpoint` name to share its entries.
+    """
+    def decorator(func):
+        name = endpoint or f"{func.__module__.split('.')[-1]}.{func.__name__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = make_key(name, *args, **kwargs)
+                # SQLite reads and writes block, so they run off the event loop
+                hit, value = await asyncio.to_thread(response_cache.get, key, kind)
+                if hit:
+                    return value
+                value = await func(*args, **kwargs)
+                if should_cache(value):
+                    await asyncio.to_thread(response_cache.set, key, value, CACHE_TTLS[kind], kind)
+                return value
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(name, *args, **kwargs)
+            hit, value = response_cache.get(key, kind)
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            if should_cache(value):
+                response_cache.set(key, value, CACHE_TTLS[kind], kind)
+            return value
+
+        return wrapper
+    return decorator
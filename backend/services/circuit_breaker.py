@@ -0,0 +1,86 @@
+"""
+Per-provider circuit breakers: after CIRCUIT_FAILURE_THRESHOLD failed or slow calls in a row,
+calls to that host fail immediately for CIRCUIT_RESET_SECONDS instead of waiting on it.
+Then a single trial call is let through; its outcome closes the circuit or opens it again.
+"""
+import os
+import threading
+import time
+
+# Consecutive failures (errors, 5xx responses or responses slower than CIRCUIT_SLOW_SECONDS) that open a circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_SLOW_SECONDS = float(os.getenv("CIRCUIT_SLOW_SECONDS", "15"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit is open"""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host} is unavailable (circuit open, retrying in {retry_in:.0f}s)")
+        self.host = host
+
+
+class CircuitBreaker:
+    def __init__(self, host, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 slow_seconds=CIRCUIT_SLOW_SECONDS, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.slow_seconds = slow_seconds
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raises CircuitOpenError unless a call may go out now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            retry_in = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == OPEN and retry_in <= 0:
+                # Let exactly one trial call through
+                self.state = HALF_OPEN
+                return
+            self.rejected += 1
+        raise CircuitOpenError(self.host, max(retry_in, 0))
+
+    def record(self, ok, seconds):
+        """Outcome of a call that went out: ok is False for errors and 5xx responses"""
+        failed = not ok or seconds > self.slow_seconds
+        with self._lock:
+            if not failed:
+                self.state, self.failures = CLOSED, 0
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"[WARNING] Circuit for {self.host} opened after {self.failures} failed or slow calls")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(host):
+    """The process-wide breaker of a provider host"""
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(host))
+    return breaker
+
+
+def stats():
+    """State of every provider's circuit"""
+    return {host: breaker.stats() for host, breaker in list(_breakers.items())}
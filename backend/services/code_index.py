@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import defaultdict
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+try:
+    from services.metrics import span
+except ImportError:
+    from metrics import span
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "travel_codes.json")
+# Codes answered by the LLM fallback are remembered here so they are only asked for once
+LEARNED_CODES_FILE = os.getenv(
+    "LEARNED_CODES_FILE", os.path.join(tempfile.gettempdir(), "trip_mitra_learned_codes.json")
+)
+FUZZY_MIN_SCORE = 0.6
+
+# Words that users and the APIs append to place names but that don't identify the place
+_NOISE_WORDS = {
+    "city", "district", "india", "airport", "international", "railway", "station",
+    "junction", "jn", "jct", "cantt", "cantonment", "terminus", "terminal",
+}
+
+
+def normalize(text):
+    """
+    Lowercases, strips accents/punctuation and noise words: 'Varanasi Jn.' -> 'varanasi'.
+    """
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    words = re.sub(r"[^a-z0-9 ]+", " ", text.lower()).split()
+    kept = [w for w in words if w not in _NOISE_WORDS]
+    return " ".join(kept or words)
+
+
+def _ngrams(text, n=3):
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class CodeIndex:
+    """
+    In-memory city -> code index with alias resolution and trigram fuzzy matching.
+    Codes for a city are kept in preference order; the first one is the primary code.
+    """
+
+    def __init__(self, entries, aliases, code_pattern):
+        self.code_pattern = re.compile(code_pattern)
+        self._aliases = {normalize(k): normalize(v) for k, v in aliases.items()}
+        self._codes = defaultdict(list)
+        self._names = {}
+        self._grams = defaultdict(set)
+        self._lock = threading.Lock()
+        for entry in entries:
+            for city in entry["cities"]:
+                self._add(city, entry["code"], entry.get("name"))
+
+    def _add(self, city, code, name=None):
+        key = normalize(city)
+        if code in self._codes[key]:
+            return
+        self._codes[key].append(code)
+        self._names.setdefault(code, name or city)
+        for gram in _ngrams(key):
+            self._grams[gram].add(key)
+
+    def _resolve(self, city):
+        key = normalize(city)
+        key = self._aliases.get(key, key)
+        if key in self._codes:
+            return key
+
+        # Fuzzy match: Dice coefficient over character trigrams of the candidate keys
+        grams = _ngrams(key)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for candidate in self._grams.get(gram, ()):
+                overlap[candidate] += 1
+        best, best_score = None, 0.0
+        for candidate, shared in overlap.items():
+            score = 2 * shared / (len(grams) + len(_ngrams(candidate)))
+            if score > best_score:
+                best, best_score = candidate, score
+        return best if best_score >= FUZZY_MIN_SCORE else None
+
+    def lookup(self, city):
+        """
+        Returns every code serving `city` (primary first), or [] if the city is unknown.
+        """
+        text = str(city).strip()
+        if self.code_pattern.fullmatch(text.upper()) and text.upper() in self._names:
+            return [text.upper()]
+        key = self._resolve(text)
+        return list(self._codes[key]) if key else []
+
+    def primary(self, city):
+        codes = self.lookup(city)
+        return codes[0] if codes else None
+
+    def is_valid(self, code):
+        return bool(self.code_pattern.fullmatch(code or ""))
+
+    def learn(self, city, code):
+        """
+        Adds a city -> code mapping (e.g. from the LLM fallback) if the code looks valid.
+        """
+        if not self.is_valid(code):
+            return False
+        with self._lock:
+            self._add(city, code)
+        return True
+
+
+def _load_learned():
+    try:
+        with open(LEARNED_CODES_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"airports": {}, "stations": {}}
+
+
+_learned_lock = threading.Lock()
+
+
+def _save_learned(kind, city, code):
+    """
+    Adds one mapping to LEARNED_CODES_FILE. The read-modify-write holds a lock (an flock on a
+    sidecar file across workers) and the new file is renamed into place, so concurrent saves
+    neither drop each other's codes nor leave a half-written file behind.
+    """
+    directory = os.path.dirname(os.path.abspath(LEARNED_CODES_FILE))
+    try:
+        with _learned_lock, open(LEARNED_CODES_FILE + ".lock", "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            learned = _load_learned()
+            learned.setdefault(kind, {})[city] = code
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".learned_codes-", suffix=".json")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(learned, f, indent=1)
+                os.replace(tmp_path, LEARNED_CODES_FILE)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+    except OSError as e:
+        print(f"[WARNING] Could not save learned code for {city}: {e}")
+
+
+def _build_indexes():
+    with open(DATA_FILE, encoding="utf-8") as f:
+        data = json.load(f)
+    airports = CodeIndex(data["airports"], data["aliases"], r"[A-Z]{3}")
+    # Bundled one-letter codes (e.g. R for Raipur) still resolve; learned ones need at least two letters
+    stations = CodeIndex(data["stations"], data["aliases"], r"[A-Z]{2,5}")
+
+    learned = _load_learned()
+    for city, code in learned.get("airports", {}).items():
+        airports.learn(city, code)
+    for city, code in learned.get("stations", {}).items():
+        stations.learn(city, code)
+    return airports, stations
+
+
+airport_index, station_index = _build_indexes()
+
+
+def resolve_code(index, kind, city, ask_llm):
+    """
+    Looks `city` up in `index`; falls back to `ask_llm(city)` and remembers the answer.
+    Returns None when the LLM's answer isn't exactly one code in the index's format.
+    """
+    code = index.primary(city)
+    if code:
+        return code
+
+    with span(f"code_lookup.{kind}.llm"):
+        answer = ask_llm(city)
+    # Tolerate quoting and a trailing period, but not prose: "The IATA code is XYZ" is rejected
+    code = str(answer).strip().strip("\"'`*.").strip().upper()
+    if not index.learn(city, code):
+        print(f"[WARNING] Ignoring LLM answer {answer!r} for the {kind[:-1]} code of {city}")
+        return None
+    _save_learned(kind, city, code)
+    return code
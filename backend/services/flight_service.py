@@ -1,31 +1,71 @@
-import requests
+import asyncio
 import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+try:
+    from services import http_client
+    from services.cache import cached
+    from services.single_flight import single_flight
+    from services.metrics import timed, propagate
+    from services.quota import QuotaError, degraded_result
+    from services.code_index import airport_index, resolve_code
+    from services.llm_registry import get_llm
+    from services.travel_dates import date_window, iso_date
+except ImportError:
+    import http_client
+    from cache import cached
+    from single_flight import single_flight
+    from metrics import timed, propagate
+    from quota import QuotaError, degraded_result
+    from code_index import airport_index, resolve_code
+    from llm_registry import get_llm
+    from travel_dates import date_window, iso_date
+
 load_dotenv()
 RAPIDAPI_KEY =  os.getenv("Flight_API_KEY")
 RAPIDAPI_HOST = "booking-com15.p.rapidapi.com"
+# Overridable so benchmarks and tests can point the service at a local stand-in
+BOOKING_API_BASE_URL = os.getenv("BOOKING_API_BASE_URL", f"https://{RAPIDAPI_HOST}")
+
+# Airports searched per city, primary first. Each extra airport multiplies the paid searches, so only
+# the primary one is searched unless a call (max_airports=) or this setting asks for e.g. DEL + HDO for Delhi
+FLIGHT_MAX_AIRPORTS = int(os.getenv("FLIGHT_MAX_AIRPORTS", "1"))
+# Flexible-date search: also search this many days before and after each travel date (0 = exact dates)
+FLIGHT_FLEX_DAYS = int(os.getenv("FLIGHT_FLEX_DAYS", "0"))
+FLIGHT_SEARCH_MAX_WORKERS = int(os.getenv("FLIGHT_SEARCH_MAX_WORKERS", "16"))
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+# Runs the fan-out of one search (every airport pair x date x leg) concurrently
+flight_search_executor = ThreadPoolExecutor(max_workers=FLIGHT_SEARCH_MAX_WORKERS, thread_name_prefix="flights")
 
-# Initialize Gemini model (you already use it in your agent)
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro")
+def ask_llm_for_airport_code(city_name: str) -> str:
+    prompt = f"What is the main IATA airport code for {city_name}? Return only the 3-letter code."
+    response = get_llm("gemini-2.5-pro").invoke(prompt)
+    return response.content.strip().upper()
 
 def get_airport_code(city_name: str) -> str:
     """
-    Uses Gemini to find the primary IATA airport code for a given city.
+    Finds the primary IATA airport code for a given city from the bundled index.
+    Falls back to Gemini for unknown cities and remembers the answer.
     Example: 'Mumbai' → 'BOM', 'New Delhi' → 'DEL'
     """
-    prompt = f"What is the main IATA airport code for {city_name}? Return only the 3-letter code."
-    response = llm.invoke(prompt)
-    return response.content.strip().upper()
+    code = resolve_code(airport_index, "airports", city_name, ask_llm_for_airport_code)
+    if not code:
+        raise ValueError(f"No airport code found for {city_name}")
+    return code
 
-def fetch_flight_data(from_city: str, to_city: str, date: str, adults: str ):
+
+def get_airport_codes(city_name: str, max_airports: int = FLIGHT_MAX_AIRPORTS) -> list:
     """
-    Fetch raw flight data from Booking.com Flight Search API.
+    The airports serving a city (primary first, at most max_airports).
+    Unknown cities fall back to the single code get_airport_code finds.
     """
-    url = f"https://{RAPIDAPI_HOST}/api/v1/flights/searchFlights"
+    codes = airport_index.lookup(city_name)
+    return codes[:max(max_airports, 1)] if codes else [get_airport_code(city_name)]
 
+def _flight_request(from_city: str, to_city: str, date: str, adults: str):
+    """Keyword arguments for http_client.get/aget"""
     querystring = {
         "fromId": f"{from_city}.AIRPORT",
         "toId": f"{to_city}.AIRPORT",
@@ -43,18 +83,51 @@ def fetch_flight_data(from_city: str, to_city: str, date: str, adults: str ):
         "x-rapidapi-key": RAPIDAPI_KEY,
         "x-rapidapi-host": RAPIDAPI_HOST
     }
+    return {
+        "url": f"{BOOKING_API_BASE_URL}/api/v1/flights/searchFlights",
+        "headers": headers,
+        "params": querystring,
+        "quota": ("flights", RAPIDAPI_KEY),
+    }
+
+
+def _check_flight_response(response):
+    response.raise_for_status()
+    data = response.json()
+    if not data.get("status", False):
+        print(" API returned failure:", data.get("message"))
+        return None
+    return data
+
+
+def _fetch_failed(error):
+    # Running out of quota degrades the whole search; any other failure only loses this lookup
+    if isinstance(error, QuotaError):
+        raise error
+    print(f"Error fetching flight data: {error}")
+    return None
+
 
+@cached("flights")
+def fetch_flight_data(from_city: str, to_city: str, date: str, adults: str ):
+    """
+    Fetch raw flight data from Booking.com Flight Search API.
+    """
     try:
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        data = response.json()
-        if not data.get("status", False):
-            print(" API returned failure:", data.get("message"))
-            return None
-        return data
+        return _check_flight_response(http_client.get(**_flight_request(from_city, to_city, date, adults)))
     except Exception as e:
-        print(f"Error fetching flight data: {e}")
-        return None
+        return _fetch_failed(e)
+
+
+@cached("flights", endpoint="flight_service.fetch_flight_data")
+async def async_fetch_flight_data(from_city: str, to_city: str, date: str, adults: str):
+    """
+    Async counterpart of fetch_flight_data.
+    """
+    try:
+        return _check_flight_response(await http_client.aget(**_flight_request(from_city, to_city, date, adults)))
+    except Exception as e:
+        return _fetch_failed(e)
 
 
 def parse_flight_data(data: dict):
@@ -77,6 +150,7 @@ def parse_flight_data(data: dict):
                 "iata": airline["iataCode"],
                 "logo": airline["logoUrl"],
                 "min_price": f"{airline['minPrice']['currencyCode']} {price_value:.2f}",
+                "price": round(price_value, 2),
                 "stops_info": [
                     {
                         "stops": s["numberOfStops"],
@@ -93,40 +167,162 @@ def parse_flight_data(data: dict):
         return []
 
 
-def get_flight_data(from_city: str, to_city: str, start_date: str, end_date: str, adults: int):
+def _round_trip_result(from_city, to_city, start_date, end_date, flights_to, flights_from):
+    return {
+        to_city+"to"+from_city: {
+            "from": from_city,
+            "to": to_city,
+            "date": start_date,
+            "flights": flights_to
+        },
+        from_city+"to"+to_city: {
+            "from": to_city,
+            "to": from_city,
+            "date": end_date,
+            "flights": flights_from
+        }
+    }
+
+
+def _search_options(start_date, end_date, flex_days, max_airports):
+    """
+    The travel dates as YYYY-MM-DD, the flex window (default FLIGHT_FLEX_DAYS) and airports per city
+    (default FLIGHT_MAX_AIRPORTS)
+    """
+    return (
+        iso_date(start_date),
+        iso_date(end_date),
+        FLIGHT_FLEX_DAYS if flex_days is None else flex_days,
+        FLIGHT_MAX_AIRPORTS if max_airports is None else max_airports,
+    )
+
+
+def _search_plan(from_codes, to_codes, start_date, end_date, flex_days):
+    """Every (leg, date, origin, destination) lookup a search needs"""
+    plan = []
+    legs = (("outbound", from_codes, to_codes, start_date), ("return", to_codes, from_codes, end_date))
+    for leg, origins, destinations, travel_date in legs:
+        for day in date_window(travel_date, flex_days):
+            for origin in origins:
+                for destination in destinations:
+                    if origin != destination:
+                        plan.append((leg, day, origin, destination))
+    return plan
+
+
+def _merge_flights(searches):
+    """
+    Merges the parsed results of several airport pairs: the cheapest offer per airline, cheapest first.
+    """
+    best = {}
+    for origin, destination, flights in searches:
+        for flight in flights:
+            key = flight.get("iata") or flight["airline"]
+            if key not in best or flight["price"] < best[key]["price"]:
+                best[key] = {**flight, "from_airport": origin, "to_airport": destination}
+    return sorted(best.values(), key=lambda flight: flight["price"])
+
+
+def _fare_matrix(cheapest_outbound, cheapest_return):
+    """
+    Cheapest round-trip fare per (outbound date, return date) pair; None where a leg has no fare
+    or the return would be before the departure.
+    """
+    outbound_dates = sorted(cheapest_outbound)
+    return_dates = sorted(cheapest_return)
+    fares = [
+        [
+            round(cheapest_outbound[out] + cheapest_return[back], 2) if back >= out else None
+            for back in return_dates
+        ]
+        for out in outbound_dates
+    ]
+    pairs = [
+        (fare, out, back)
+        for out, row in zip(outbound_dates, fares)
+        for back, fare in zip(return_dates, row)
+        if fare is not None
+    ]
+    cheapest = min(pairs, default=None)
+    return {
+        "outbound_dates": outbound_dates,
+        "return_dates": return_dates,
+        "fares": fares,
+        "cheapest": {"depart": cheapest[1], "return": cheapest[2], "total": cheapest[0]} if cheapest else None,
+    }
+
+
+def _search_error(error):
+    return degraded_result(error) if isinstance(error, QuotaError) else {"error": str(error)}
+
+
+def _assemble_search(from_city, to_city, start_date, end_date, plan, raw_results, flex_days):
+    searches = defaultdict(list)
+    for (leg, day, origin, destination), raw in zip(plan, raw_results):
+        searches[(leg, day)].append((origin, destination, parse_flight_data(raw) if raw else []))
+
+    flights_to = _merge_flights(searches[("outbound", start_date)])
+    flights_from = _merge_flights(searches[("return", end_date)])
+    result = _round_trip_result(from_city, to_city, start_date, end_date, flights_to, flights_from)
+
+    if flex_days:
+        cheapest = {"outbound": {}, "return": {}}
+        for (leg, day), leg_searches in searches.items():
+            merged = _merge_flights(leg_searches)
+            if merged:
+                cheapest[leg][day] = merged[0]["price"]
+        result["fare_matrix"] = _fare_matrix(cheapest["outbound"], cheapest["return"])
+    return result
+
+
+@timed("service.flights")
+@single_flight()
+def get_flight_data(from_city: str, to_city: str, start_date: str, end_date: str, adults: int, flex_days: int = None,
+                    max_airports: int = None):
     """
     Fetch both departure and return flight data between two cities.
-    Returns a structured dict containing to_city and from_city flight data.
+    Up to max_airports airports per city (default FLIGHT_MAX_AIRPORTS) are searched and, with flex_days
+    (default FLIGHT_FLEX_DAYS), every date within ±flex_days of the travel dates; all lookups run concurrently.
+    Returns a structured dict containing to_city and from_city flight data for the requested dates,
+    plus a "fare_matrix" of cheapest round-trip fares per date pair in flexible mode.
     """
-    from_code = get_airport_code(from_city)
-    to_code = get_airport_code(to_city)
+    try:
+        start_date, end_date, flex_days, max_airports = _search_options(start_date, end_date, flex_days, max_airports)
+        plan = _search_plan(
+            get_airport_codes(from_city, max_airports), get_airport_codes(to_city, max_airports),
+            start_date, end_date, flex_days,
+        )
+        raw_results = list(flight_search_executor.map(
+            propagate(lambda lookup: fetch_flight_data(lookup[2], lookup[3], lookup[1], adults)), plan
+        ))
+        return _assemble_search(from_city, to_city, start_date, end_date, plan, raw_results, flex_days)
 
+    except Exception as e:
+        return _search_error(e)
+
+
+@timed("service.flights")
+@single_flight(endpoint="flight_service.get_flight_data")
+async def async_get_flight_data(from_city: str, to_city: str, start_date: str, end_date: str, adults: int,
+                                flex_days: int = None, max_airports: int = None):
+    """
+    Async counterpart of get_flight_data.
+    """
     try:
-        #  Outgoing flight (from → to)
-        raw_data_to = fetch_flight_data(from_code, to_code, start_date,adults)
-        flights_to = parse_flight_data(raw_data_to) if raw_data_to else []
-
-        #  Return flight (to → from)
-        raw_data_from = fetch_flight_data(to_code, from_code, end_date,adults)
-        flights_from = parse_flight_data(raw_data_from) if raw_data_from else []
-
-        return {
-            to_city+"to"+from_city: {
-                "from": from_city,
-                "to": to_city,
-                "date": start_date,
-                "flights": flights_to
-            },
-            from_city+"to"+to_city: {
-                "from": to_city,
-                "to": from_city,
-                "date": end_date,
-                "flights": flights_from
-            }
-        }
+        start_date, end_date, flex_days, max_airports = _search_options(start_date, end_date, flex_days, max_airports)
+        from_codes, to_codes = await asyncio.gather(
+            asyncio.to_thread(get_airport_codes, from_city, max_airports),
+            asyncio.to_thread(get_airport_codes, to_city, max_airports),
+        )
+
+        plan = _search_plan(from_codes, to_codes, start_date, end_date, flex_days)
+        raw_results = await asyncio.gather(*(
+            async_fetch_flight_data(origin, destination, day, adults) for _, day, origin, destination in plan
+        ))
+        return _assemble_search(from_city, to_city, start_date, end_date, plan, raw_results, flex_days)
 
     except Exception as e:
-        return {"error": str(e)}
+        return _search_error(e)
 
 
 # if __name__ == "__main__":
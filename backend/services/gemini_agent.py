@@ -1,23 +1,27 @@
 import os
-from langchain.agents import initialize_agent, Tool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.agents.agent_types import AgentType
-from langchain.tools import StructuredTool
-
+import asyncio
+import contextlib
+import contextvars
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 
 # Import service functions - adjust these imports based on your actual structure
 try:
-    from services.weather_service import parse_weather_data
-    from services.hotel_service import parse_hotel_info
-    from services.train_service import get_trains_to_and_from_city
-    from services.flight_service import get_flight_data
+    from services.llm_registry import get_llm
+    from services.metrics import llm_callback_handler, propagate, span
+    from services.weather_service import parse_weather_data, async_parse_weather_data
+    from services.hotel_service import parse_hotel_info, async_parse_hotel_info
+    from services.train_service import get_trains_to_and_from_city, async_get_trains_to_and_from_city
+    from services.flight_service import get_flight_data, async_get_flight_data
 except ImportError:
 
-    from weather_service import parse_weather_data
-    from hotel_service import parse_hotel_info
-    from train_service import get_trains_to_and_from_city
-    from flight_service import get_flight_data
+    from llm_registry import get_llm
+    from metrics import llm_callback_handler, propagate, span
+    from weather_service import parse_weather_data, async_parse_weather_data
+    from hotel_service import parse_hotel_info, async_parse_hotel_info
+    from train_service import get_trains_to_and_from_city, async_get_trains_to_and_from_city
+    from flight_service import get_flight_data, async_get_flight_data
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -27,6 +31,14 @@ if not GOOGLE_API_KEY:
     raise ValueError(
         "GOOGLE_API_KEY not found in environment variables. Make sure it's loaded before importing this module.")
 
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", "16"))
+PREFETCH_TIMEOUT = float(os.getenv("PREFETCH_TIMEOUT", "120"))
+
+TOOL_NAMES = ("get_trains", "get_flights", "get_hotels", "get_weather_forecast")
+
+# Shared across requests so the number of in-flight service calls stays bounded
+prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_MAX_WORKERS, thread_name_prefix="prefetch")
+
 
 class WeatherTool:
     def __call__(self, to_city, start_date, end_date):
@@ -37,9 +49,9 @@ class WeatherTool:
 
 
 class HotelTool:
-    def __call__(self, to_city, start_date, end_date, adults):
+    def __call__(self, to_city, start_date, end_date, adults, budget=None):
         try:
-            return parse_hotel_info(to_city, start_date, end_date, adults)
+            return parse_hotel_info(to_city, start_date, end_date, adults, budget=budget)
         except Exception as e:
             return f"Hotel tool failed: {str(e)}"
 
@@ -48,7 +60,7 @@ class FlightTool:
         try:
             return get_flight_data(from_city,to_city, start_date, end_date, adults)
         except Exception as e:
-            return f"Hotel tool failed: {str(e)}"
+            return f"Flight tool failed: {str(e)}"
 
 
 class TrainTool:
@@ -59,74 +71,198 @@ class TrainTool:
             return f"Train tool failed: {str(e)}"
 
 
+def iter_prefetch_trip_data(from_city, to_city, start_date, end_date, adults, budget=None):
+    """
+    Runs all four service calls concurrently on the shared executor.
+    Yields (tool name, result or failure message) as each call finishes.
+    """
+    jobs = {
+        "get_trains": (TrainTool(), (from_city, to_city, str(start_date), str(end_date))),
+        "get_flights": (FlightTool(), (from_city, to_city, str(start_date), str(end_date), adults)),
+        "get_hotels": (HotelTool(), (to_city, str(start_date), str(end_date), adults, budget)),
+        "get_weather_forecast": (WeatherTool(), (to_city, str(start_date), str(end_date))),
+    }
+    futures = {prefetch_executor.submit(propagate(tool), *args): name for name, (tool, args) in jobs.items()}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=PREFETCH_TIMEOUT):
+            pending.discard(future)
+            yield futures[future], future.result()
+    except TimeoutError:
+        for future in pending:
+            future.cancel()
+            yield futures[future], f"{futures[future]} timed out after {PREFETCH_TIMEOUT:.0f}s"
 
-def get_agent(from_city, to_city, start_date, end_date, adults):
+
+def prefetch_trip_data(from_city, to_city, start_date, end_date, adults, budget=None):
     """
-    Creates a LangChain agent with travel planning tools.
+    Runs all four service calls concurrently and returns a dict keyed by tool name.
     """
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        google_api_key=GOOGLE_API_KEY,
+    return dict(iter_prefetch_trip_data(from_city, to_city, start_date, end_date, adults, budget))
+
+
+async def _guarded(coro, failure_message):
+    try:
+        return await coro
+    except Exception as e:
+        return f"{failure_message}: {str(e)}"
+
+
+async def _weather_json(to_city, start_date, end_date):
+    return json.dumps(await async_parse_weather_data(to_city, start_date, end_date), indent=2)
+
+
+async def async_prefetch_trip_data(from_city, to_city, start_date, end_date, adults, budget=None):
+    """
+    Async counterpart of prefetch_trip_data: runs the async services concurrently on the event loop.
+    """
+    start_date, end_date = str(start_date), str(end_date)
+    jobs = {
+        "get_trains": _guarded(
+            async_get_trains_to_and_from_city(from_city, to_city, start_date, end_date), "Train tool failed"),
+        "get_flights": _guarded(
+            async_get_flight_data(from_city, to_city, start_date, end_date, adults), "Flight tool failed"),
+        "get_hotels": _guarded(
+            async_parse_hotel_info(to_city, start_date, end_date, adults, budget=budget), "Hotel tool failed"),
+        "get_weather_forecast": _guarded(
+            _weather_json(to_city, start_date, end_date), "Could not get weather data"),
+    }
+    tasks = {name: asyncio.ensure_future(coro) for name, coro in jobs.items()}
+    done, pending = await asyncio.wait(tasks.values(), timeout=PREFETCH_TIMEOUT)
+    for task in pending:
+        task.cancel()
+    return {
+        name: task.result() if task in done else f"{name} timed out after {PREFETCH_TIMEOUT:.0f}s"
+        for name, task in tasks.items()
+    }
+
+
+def format_prefetched_data(prefetched):
+    """
+    Renders prefetched tool results as prompt text, one section per tool.
+    """
+    sections = []
+    for name in TOOL_NAMES:
+        if name not in prefetched:
+            continue
+        result = prefetched[name]
+        body = result if isinstance(result, str) else json.dumps(result, indent=2, ensure_ascii=False)
+        sections.append(f"### {name}\n{body}")
+    return "\n\n".join(sections)
+
+
+def get_planner_llm():
+    """
+    The model that writes the itinerary, for the agent or for direct (streamed) generation.
+    """
+    return get_llm(
+        "gemini-2.0-flash",
         temperature=0.5,
+        google_api_key=GOOGLE_API_KEY,
         timeout=240,
         max_retries=3
     )
 
-    # Create tool instances
-    weather_tool_instance = WeatherTool()
-    hotel_tool_instance = HotelTool()
-    train_tool_instance = TrainTool()
-    flight_tool_instance = FlightTool()
+
+# Trip parameters and prefetched tool results of the request currently being planned.
+# The agent and its tools are shared by all requests; each request binds its own trip here.
+trip_context = contextvars.ContextVar("trip_context")
+
+
+@contextlib.contextmanager
+def bind_trip(details, prefetched=None):
+    """
+    Makes `details` (from_city, to_city, start_date, end_date, adults, budget) and
+    the prefetched tool results visible to the agent's tools for the duration of the block.
+    """
+    token = trip_context.set({**details, "prefetched": prefetched or {}})
+    try:
+        yield
+    finally:
+        trip_context.reset(token)
+
+
+# How each tool fetches its data when it wasn't prefetched
+_TOOL_CALLS = {
+    "get_weather_forecast": lambda t: WeatherTool()(t["to_city"], str(t["start_date"]), str(t["end_date"])),
+    "get_hotels": lambda t: HotelTool()(
+        t["to_city"], str(t["start_date"]), str(t["end_date"]), t["adults"], t.get("budget")),
+    "get_trains": lambda t: TrainTool()(t["from_city"], t["to_city"], str(t["start_date"]), str(t["end_date"])),
+    "get_flights": lambda t: FlightTool()(
+        t["from_city"], t["to_city"], str(t["start_date"]), str(t["end_date"]), t["adults"]),
+}
+
+_TOOL_DESCRIPTIONS = {
+    "get_weather_forecast": "Use this to get the weather forecast for the trip's destination and dates. Just pass any string like 'fetch' or 'get weather'.",
+    "get_hotels": "Use this to get hotel listings at the trip's destination for its travellers and dates. Just pass any string like 'fetch' or 'get hotels'.",
+    "get_trains": "Use this to get train schedules for the trip's outbound and return dates. Just pass any string like 'fetch' or 'get trains'.",
+    "get_flights": "Use this to get flight schedules for the trip's outbound and return dates. Just pass any string like 'fetch' or 'get flights'.",
+}
+
+
+def _call_tool(name):
+    trip = trip_context.get(None)
+    if trip is None:
+        return f"{name} failed: no trip details available"
+    if name in trip["prefetched"]:
+        return trip["prefetched"][name]
+    with span(f"tool.{name}"):
+        return _TOOL_CALLS[name](trip)
+
+
+async def _acall_tool(name):
+    trip = trip_context.get(None)
+    if trip is not None and name in trip["prefetched"]:
+        return trip["prefetched"][name]
+    # to_thread copies the context, so the bound trip is visible in the worker thread
+    return await asyncio.to_thread(_call_tool, name)
+
+
+def _make_tool(name):
+    # LangChain is heavy to import; load it with the first agent instead of at startup
+    from langchain.tools import StructuredTool
 
     # Wrapper functions that accept a dummy input
-    def get_weather_wrapper(query: str = "fetch") -> str:
-        """Get weather forecast for the destination city."""
-        return weather_tool_instance(to_city, str(start_date), str(end_date))
-
-    def get_hotels_wrapper(query: str = "fetch") -> str:
-        """Get hotel information for the destination city."""
-        return hotel_tool_instance(to_city, str(start_date), str(end_date), adults)
-
-    def get_trains_wrapper(query: str = "fetch") -> str:
-        """Get train information between origin and destination."""
-        return train_tool_instance(from_city, to_city, str(start_date), str(end_date))
-
-    def get_flights_wrapper(query: str= "fetch") -> str:
-        """Get flight information between origin and destination."""
-        return flight_tool_instance(from_city, to_city, str(start_date), str(end_date),adults)
-    # Define tools using StructuredTool
-    tools = [
-        StructuredTool.from_function(
-            func=get_weather_wrapper,
-            name="get_weather_forecast",
-            description=f"Use this to get weather forecast for {to_city} from {start_date} to {end_date}. Just pass any string like 'fetch' or 'get weather'."
-        ),
-        StructuredTool.from_function(
-            func=get_hotels_wrapper,
-            name="get_hotels",
-            description=f"Use this to get hotel listings in {to_city} for {adults} adults from {start_date} to {end_date}. Just pass any string like 'fetch' or 'get hotels'."
-        ),
-        StructuredTool.from_function(
-            func=get_trains_wrapper,
-            name="get_trains",
-            description=f"Use this to get train schedules from {from_city} to {to_city}. Outbound on {start_date}, return on {end_date}. Just pass any string like 'fetch' or 'get trains'."
-        ),
-        StructuredTool.from_function(
-            func=get_flights_wrapper,
-            name="get_flights",
-            description=f"Use this to get flights schedules from {from_city} to {to_city} for {adults}. Outbound on {start_date}, return on {end_date}. Just pass any string like 'fetch' or 'get flights'."
-        )
-
-    ]
-
-    return initialize_agent(
-        tools,
-        llm,
-        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-        verbose=True,
-        handle_parsing_errors="Provide your Final Answer now with the itinerary in markdown format.",
-        max_iterations=12,  # Reduced from 15
-        max_execution_time=180,  # 3 minutes max
-        early_stopping_method="force",  # Force stop if taking too long
-        return_intermediate_steps=False
-    )
\ No newline at end of file
+    def run(query: str = "fetch") -> str:
+        return _call_tool(name)
+
+    async def arun(query: str = "fetch") -> str:
+        return await _acall_tool(name)
+
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name=name,
+        description=_TOOL_DESCRIPTIONS[name],
+    )
+
+
+_agent = None
+_agent_lock = threading.Lock()
+
+
+def get_agent():
+    """
+    The LangChain agent with travel planning tools, built once per process.
+    Run it inside bind_trip(...) so its tools know which trip to fetch (or return prefetched data for).
+    """
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                from langchain.agents import initialize_agent
+                from langchain.agents.agent_types import AgentType
+
+                _agent = initialize_agent(
+                    [_make_tool(name) for name in TOOL_NAMES],
+                    get_planner_llm(),
+                    agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+                    verbose=True,
+                    handle_parsing_errors="Provide your Final Answer now with the itinerary in markdown format.",
+                    max_iterations=12,  # Reduced from 15
+                    max_execution_time=180,  # 3 minutes max
+                    early_stopping_method="force",  # Force stop if taking too long
+                    return_intermediate_steps=False,
+                    callbacks=[llm_callback_handler()],  # times each ReAct iteration
+                )
+    return _agent
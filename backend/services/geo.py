@@ -0,0 +1,150 @@
+import math
+import os
+from collections import defaultdict
+
+import numpy as np
+
+try:
+    from services.cache import cached
+except ImportError:
+    from cache import cached
+
+EARTH_RADIUS_KM = 6371.0
+# Grid cell size of the attraction index, in degrees (~5.5 km of latitude)
+GEO_GRID_CELL_DEG = float(os.getenv("GEO_GRID_CELL_DEG", "0.05"))
+NEARBY_ATTRACTIONS_K = int(os.getenv("NEARBY_ATTRACTIONS_K", "3"))
+NEARBY_ATTRACTIONS_MAX_KM = float(os.getenv("NEARBY_ATTRACTIONS_MAX_KM", "15"))
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in km. Accepts scalars or NumPy arrays (broadcast like any ufunc).
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+@cached("places")
+def get_attractions(destination):
+    """
+    All popular places the Places API returns for a destination, as compact
+    {"name", "lat", "lng", "rating"} records.
+    """
+    try:
+        from services.weather_service import search_places
+    except ImportError:
+        from weather_service import search_places
+
+    return [
+        {
+            "name": place.get("name"),
+            "lat": place["geometry"]["location"]["lat"],
+            "lng": place["geometry"]["location"]["lng"],
+            "rating": place.get("rating"),
+        }
+        for place in search_places(destination)
+        if place.get("geometry", {}).get("location")
+    ]
+
+
+class AttractionIndex:
+    """
+    Uniform lat/lng grid over a set of attractions.
+    Queries only look at the grid cells that can hold points within the search radius,
+    then measure exact haversine distances to those candidates in one NumPy pass.
+    """
+
+    def __init__(self, attractions, cell_deg=GEO_GRID_CELL_DEG):
+        self.attractions = list(attractions)
+        self.cell_deg = cell_deg
+        self.lats = np.array([a["lat"] for a in self.attractions], dtype=float)
+        self.lngs = np.array([a["lng"] for a in self.attractions], dtype=float)
+        self._cells = defaultdict(list)
+        for i, (lat, lng) in enumerate(zip(self.lats, self.lngs)):
+            self._cells[self._cell(lat, lng)].append(i)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def _candidates(self, min_lat, max_lat, min_lng, max_lng, radius_km):
+        # Widen the box by the radius (longitude degrees shrink towards the poles)
+        dlat = radius_km / 111.0
+        dlng = radius_km / (111.0 * max(math.cos(math.radians(max(abs(min_lat), abs(max_lat)))), 0.01))
+        lo = self._cell(min_lat - dlat, min_lng - dlng)
+        hi = self._cell(max_lat + dlat, max_lng + dlng)
+        if (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) > len(self._cells):
+            return np.array(sorted(i for cell in self._cells.values() for i in cell), dtype=int)
+        found = []
+        for row in range(lo[0], hi[0] + 1):
+            for col in range(lo[1], hi[1] + 1):
+                found.extend(self._cells.get((row, col), ()))
+        return np.array(sorted(found), dtype=int)
+
+    def within(self, lat, lng, radius_km):
+        """
+        Attractions within `radius_km` of a point, nearest first, as (attraction, distance_km).
+        """
+        idx = self._candidates(lat, lat, lng, lng, radius_km)
+        if not len(idx):
+            return []
+        distances = haversine_km(lat, lng, self.lats[idx], self.lngs[idx])
+        order = np.argsort(distances)
+        return [(self.attractions[idx[i]], float(distances[i])) for i in order if distances[i] <= radius_km]
+
+    def nearest(self, lats, lngs, k=NEARBY_ATTRACTIONS_K, max_km=NEARBY_ATTRACTIONS_MAX_KM):
+        """
+        For each point, its `k` nearest attractions within `max_km` as (attraction, distance_km) lists.
+        All points are measured against the candidate attractions in a single batched haversine pass.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        valid = ~(np.isnan(lats) | np.isnan(lngs))
+        results = [[] for _ in range(len(lats))]
+        if not valid.any() or not self.attractions:
+            return results
+
+        idx = self._candidates(lats[valid].min(), lats[valid].max(), lngs[valid].min(), lngs[valid].max(), max_km)
+        if not len(idx):
+            return results
+
+        # (points x candidates) distance matrix
+        distances = haversine_km(lats[:, None], lngs[:, None], self.lats[idx][None, :], self.lngs[idx][None, :])
+        k = min(k, len(idx))
+        nearest = np.argsort(distances, axis=1)[:, :k]
+        for row in np.flatnonzero(valid):
+            results[row] = [
+                (self.attractions[idx[col]], float(distances[row, col]))
+                for col in nearest[row]
+                if distances[row, col] <= max_km
+            ]
+        return results
+
+
+def _coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def attach_nearby_attractions(hotels, attractions, k=NEARBY_ATTRACTIONS_K, max_km=NEARBY_ATTRACTIONS_MAX_KM):
+    """
+    Adds "nearby_attractions" ([{"name", "distance_km"}], nearest first) to each hotel record in place.
+    """
+    if not hotels:
+        return hotels
+    index = AttractionIndex(attractions)
+    nearby = index.nearest(
+        [_coordinate(h.get("latitude")) for h in hotels],
+        [_coordinate(h.get("longitude")) for h in hotels],
+        k=k, max_km=max_km,
+    )
+    for hotel, places in zip(hotels, nearby):
+        hotel["nearby_attractions"] = [
+            {"name": place["name"], "distance_km": round(distance, 2)} for place, distance in places
+        ]
+    return hotels
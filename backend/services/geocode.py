@@ -0,0 +1,53 @@
+import json
+import os
+
+try:
+    from services.cache import CACHE_TTLS, make_key, response_cache
+    from services.code_index import DATA_FILE as CODES_FILE, normalize
+except ImportError:
+    from cache import CACHE_TTLS, make_key, response_cache
+    from code_index import DATA_FILE as CODES_FILE, normalize
+
+DESTINATIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "destinations.json")
+
+
+def _load_preloaded():
+    with open(DESTINATIONS_FILE, encoding="utf-8") as f:
+        destinations = json.load(f)
+    with open(CODES_FILE, encoding="utf-8") as f:
+        aliases = json.load(f)["aliases"]
+    return (
+        {normalize(name): {"lat": lat, "lng": lng} for name, (lat, lng) in destinations.items()},
+        {normalize(alias): normalize(name) for alias, name in aliases.items()},
+    )
+
+
+# Coordinates of popular Indian destinations, so most lookups never leave the process
+PRELOADED_COORDINATES, _ALIASES = _load_preloaded()
+
+
+def get_coordinates(location):
+    """
+    Returns {"lat": ..., "lng": ...} for a place name.
+    Served from the preloaded destinations, then the permanent geocode cache,
+    and only then from the Places API (whose answer is cached indefinitely).
+    """
+    key = normalize(location)
+    for candidate in (key, _ALIASES.get(key)):
+        if candidate in PRELOADED_COORDINATES:
+            return dict(PRELOADED_COORDINATES[candidate])
+
+    cache_key = make_key("geocode", key)
+    hit, loc = response_cache.get(cache_key, "geocode")
+    if hit:
+        return dict(loc)
+
+    # Imported here because weather_service itself geocodes through this module
+    try:
+        from services.weather_service import get_maps_places
+    except ImportError:
+        from weather_service import get_maps_places
+
+    loc = get_maps_places(location, search_text="")
+    response_cache.set(cache_key, loc, CACHE_TTLS["geocode"], "geocode")
+    return dict(loc)
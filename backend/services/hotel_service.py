@@ -1,22 +1,71 @@
-import requests
+import asyncio
+import contextlib
 import os
-import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from dotenv import load_dotenv
+
+try:
+    from services import http_client
+    from services.cache import cached
+    from services.single_flight import single_flight
+    from services.metrics import timed, propagate
+    from services.quota import QuotaError, degraded_result
+    from services.geo import attach_nearby_attractions, get_attractions, haversine_km
+    from services.geocode import get_coordinates
+except ImportError:
+    import http_client
+    from cache import cached
+    from single_flight import single_flight
+    from metrics import timed, propagate
+    from quota import QuotaError, degraded_result
+    from geo import attach_nearby_attractions, get_attractions, haversine_km
+    from geocode import get_coordinates
+
 load_dotenv()
 HOTELS_API_KEY = os.getenv("HOTELS_API_KEY")
+# Overridable so benchmarks and tests can point the service at a local stand-in
+BOOKING_API_BASE_URL = os.getenv("BOOKING_API_BASE_URL", "https://booking-com15.p.rapidapi.com")
+HOTEL_MAX_PAGES = int(os.getenv("HOTEL_MAX_PAGES", "5"))
 
-def get_destination_data(query):
-    url = "https://booking-com15.p.rapidapi.com/api/v1/hotels/searchDestination"
-    headers = {
-        "x-rapidapi-key": HOTELS_API_KEY,
-        "x-rapidapi-host": "booking-com15.p.rapidapi.com"
+# How many ranked hotels are handed to the planner (0 = all of them)
+HOTEL_TOP_K = int(os.getenv("HOTEL_TOP_K", "10"))
+# Share of the total trip budget assumed to go to accommodation when scoring prices
+HOTEL_BUDGET_SHARE = float(os.getenv("HOTEL_BUDGET_SHARE", "0.4"))
+HOTEL_RANK_WEIGHTS = {
+    "price": 0.35,
+    "review": 0.30,
+    "review_count": 0.10,
+    "stars": 0.10,
+    "distance": 0.15,
+}
+
+# Result pages requested ahead of the one being consumed. By default every remaining page is fetched at
+# once, as before; lower it to spend fewer calls when the first pages usually have enough good hotels
+HOTEL_PAGE_LOOKAHEAD = int(os.getenv("HOTEL_PAGE_LOOKAHEAD", str(max(HOTEL_MAX_PAGES - 1, 1))))
+# Pagination stops once this many hotels are within budget and well reviewed (0 = twice top_k)
+HOTEL_ENOUGH_CANDIDATES = int(os.getenv("HOTEL_ENOUGH_CANDIDATES", "0"))
+HOTEL_MIN_REVIEW_SCORE = float(os.getenv("HOTEL_MIN_REVIEW_SCORE", "7"))
+
+hotel_page_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hotel-pages")
+
+def _destination_request(query):
+    """Keyword arguments for http_client.get/aget"""
+    return {
+        "url": f"{BOOKING_API_BASE_URL}/api/v1/hotels/searchDestination",
+        "headers": {
+            "x-rapidapi-key": HOTELS_API_KEY,
+            "x-rapidapi-host": "booking-com15.p.rapidapi.com"
+        },
+        "params": {"query": query},
+        "quota": ("hotels", HOTELS_API_KEY),
     }
-    params = {"query": query}
 
-    res = requests.get(url, headers=headers, params=params)
-    res.raise_for_status()
-    data = res.json()
 
+def _parse_destination(response):
+    response.raise_for_status()
+    data = response.json()
     if not data.get("status") or not data.get("data"):
         raise Exception("No destination data found")
 
@@ -30,101 +79,437 @@ def get_destination_data(query):
     }
 
 
-def search_hotels(city_name, start_date, end_date, adults):
-    dest = get_destination_data(city_name)
-    url = "https://booking-com15.p.rapidapi.com/api/v1/hotels/searchHotels"
+@cached("places")
+def get_destination_data(query):
+    return _parse_destination(http_client.get(**_destination_request(query)))
+
+
+@cached("places", endpoint="hotel_service.get_destination_data")
+async def async_get_destination_data(query):
+    return _parse_destination(await http_client.aget(**_destination_request(query)))
+
+
+def _hotel_search_request(dest_id, start_date, end_date, adults, page_number):
+    """Keyword arguments for http_client.get/aget"""
     headers = {
         "x-rapidapi-key": HOTELS_API_KEY,
         "x-rapidapi-host": "booking-com15.p.rapidapi.com"
     }
+    params = {
+        "dest_id": dest_id,
+        "search_type": "CITY",
+        "adults": str(adults),
+        "room_qty": "1",
+        "units": "metric",
+        "languagecode": "en-us",
+        "currency_code": "INR",
+        "arrival_date": start_date,
+        "departure_date": end_date,
+        "page_number": str(page_number),
+    }
+    return {
+        "url": f"{BOOKING_API_BASE_URL}/api/v1/hotels/searchHotels",
+        "headers": headers,
+        "params": params,
+        "quota": ("hotels", HOTELS_API_KEY),
+    }
 
-    all_hotels, page_number, max_pages = [], 1, 5
-    has_more_pages = True
-    while has_more_pages and page_number <= max_pages:
-        params = {
-            "dest_id": dest["dest_id"],
-            "search_type": "CITY",
-            "adults": str(adults),
-            "room_qty": "1",
-            "page_number": str(page_number),
-            "units": "metric",
-            "languagecode": "en-us",
-            "currency_code": "INR",
-            "arrival_date": start_date,
-            "departure_date": end_date,
-        }
 
-        try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()  # Raise exception for HTTP errors
-
-            data = response.json()
-
-            # Check the structure of the response
-            if isinstance(data, dict) and "data" in data:
-                if "hotels" in data["data"] and isinstance(data["data"]["hotels"], list):
-                    current_page_hotels = data["data"]["hotels"]
-                    all_hotels.extend(current_page_hotels)
-
-                    # Check if there are more pages
-                    if len(current_page_hotels) == 0:
-                        has_more_pages = False
-                        print(f"No more hotels found after page {page_number - 1}")
-                    elif "meta" in data["data"]:
-                        meta = data["data"]["meta"]
-                        if isinstance(meta, dict) and "page_number" in meta and "total_pages" in meta:
-                            current_page = int(meta["page_number"])
-                            total_pages = int(meta["total_pages"])
-                            print(f"Page {current_page} of {total_pages}")
-
-                            if current_page >= total_pages:
-                                has_more_pages = False
-                                print("Reached the last page")
-                        else:
-                            # If we can't determine total pages but got results, try the next page
-                            print(f"Got {len(current_page_hotels)} hotels on page {page_number}")
-                else:
-                    print("No hotels data found in the response")
-                    has_more_pages = False
-            else:
-                print("Unexpected response format")
-                has_more_pages = False
-
-            page_number += 1
-
-            # Add a delay to avoid rate limiting
-            time.sleep(1.5)
-
-        except Exception as e:
-            print(f"Error fetching page {page_number}: {str(e)}")
-            break
-
-    print(f"Total hotels collected: {len(all_hotels)}")
+def _compact_hotel(hotel):
+    """
+    The fields ranking and the planner need from a raw searchHotels entry.
+    """
+    prop = hotel["property"]
+    labels = hotel.get("accessibilityLabel", "")
     return {
-        "total_hotels": len(all_hotels),
-        "hotels": all_hotels
+        "name": prop["name"],
+        "accuratePropertyClass": prop.get("accuratePropertyClass"),
+        "reviewScore": prop.get("reviewScore"),
+        "reviewScoreWord": prop.get("reviewScoreWord", ""),
+        "reviewCount": prop.get("reviewCount"),
+        "checkin": prop["checkin"],
+        "checkout": prop["checkout"],
+        "price": _stay_price(prop),
+        "free_cancellation": "Free cancellation" in labels,
+        "no_prepayment": "No prepayment" in labels,
+        "photo": prop["photoUrls"][0] if prop.get("photoUrls") else None,
+        "latitude": prop.get("latitude"),
+        "longitude": prop.get("longitude"),
     }
 
-def parse_hotel_info(city_name, start_date, end_date, adults):
-    hotels_data = search_hotels(city_name, start_date, end_date, adults)
-    results = []
-    for hotel in hotels_data["hotels"]:
-        prop = hotel["property"]
-        price_info = prop["priceBreakdown"]
-        total = round(price_info["grossPrice"]["value"] + price_info["excludedPrice"]["value"])
-        info = {
-            "name": prop["name"],
-            "rating": f'{prop.get("accuratePropertyClass", "N/A")} out of 5',
-            "review_score": f'{prop.get("reviewScore", "N/A")} ({prop.get("reviewScoreWord", "")})',
-            "review_count": prop.get("reviewCount", "N/A"),
-            "checkin": prop["checkin"],
-            "checkout": prop["checkout"],
-            "price(incl_taxes)": total,
-            "free_cancellation": "YES" if "Free cancellation" in hotel["accessibilityLabel"] else "NO",
-            "no_prepayment": "YES" if "No prepayment" in hotel["accessibilityLabel"] else "NO",
-            "photo": prop["photoUrls"][0] if prop.get("photoUrls") else "No image",
-            "longitude": prop.get("longitude", "N/A"),
-            "latitude": prop.get("latitude", "N/A")
-        }
-        results.append(info)
-    return results
+
+def _parse_hotel_page(data):
+    """
+    Returns (compact hotels, meta) from a searchHotels response.
+    """
+    # Check the structure of the response
+    if not isinstance(data, dict) or "data" not in data:
+        print("Unexpected response format")
+        return [], {}
+    if "hotels" not in data["data"] or not isinstance(data["data"]["hotels"], list):
+        print("No hotels data found in the response")
+        return [], {}
+
+    hotels = []
+    for hotel in data["data"]["hotels"]:
+        try:
+            hotels.append(_compact_hotel(hotel))
+        except (KeyError, TypeError) as e:
+            print(f"[WARNING] Skipping malformed hotel entry: {e}")
+    meta = data["data"].get("meta")
+    return hotels, meta if isinstance(meta, dict) else {}
+
+
+def _page_result(response, page_number):
+    response.raise_for_status()  # Raise exception for HTTP errors
+    hotels, meta = _parse_hotel_page(response.json())
+    # Without a page count, keep paginating until a page comes back empty (or HOTEL_MAX_PAGES)
+    total_pages = HOTEL_MAX_PAGES if hotels else 1
+    if hotels and "total_pages" in meta:
+        if page_number == 1:
+            print(f"Page 1 of {meta['total_pages']}")
+        total_pages = min(int(meta["total_pages"]), HOTEL_MAX_PAGES)
+    elif hotels and page_number == 1:
+        print(f"Got {len(hotels)} hotels on page 1, page count unknown")
+    return {"hotels": hotels, "total_pages": total_pages}
+
+
+@cached("hotels", should_cache=lambda page: bool(page["hotels"]))
+def fetch_hotel_page(dest_id, start_date, end_date, adults, page_number):
+    """
+    One searchHotels page as compact hotel records plus the (capped) page count.
+    The raw JSON is dropped as soon as the page is parsed. Each attempt is reserved from the hotels quota.
+    """
+    request = _hotel_search_request(dest_id, start_date, end_date, adults, page_number)
+    return _page_result(http_client.get(**request), page_number)
+
+
+@cached("hotels", should_cache=lambda page: bool(page["hotels"]), endpoint="hotel_service.fetch_hotel_page")
+async def async_fetch_hotel_page(dest_id, start_date, end_date, adults, page_number):
+    request = _hotel_search_request(dest_id, start_date, end_date, adults, page_number)
+    return _page_result(await http_client.aget(**request), page_number)
+
+
+_EMPTY_PAGE = {"hotels": [], "total_pages": 1}
+
+
+def _failed_page(error, page_number):
+    # Running out of quota stops pagination; any other failure reads as an empty page
+    if isinstance(error, QuotaError):
+        raise error
+    print(f"Error fetching page {page_number}: {str(error)}")
+    return _EMPTY_PAGE
+
+
+def _page_or_empty(dest_id, start_date, end_date, adults, page_number):
+    try:
+        return fetch_hotel_page(dest_id, start_date, end_date, adults, page_number)
+    except Exception as e:
+        return _failed_page(e, page_number)
+
+
+async def _async_page_or_empty(dest_id, start_date, end_date, adults, page_number):
+    try:
+        return await async_fetch_hotel_page(dest_id, start_date, end_date, adults, page_number)
+    except Exception as e:
+        return _failed_page(e, page_number)
+
+
+class _PageSchedule:
+    """
+    Which result pages to request while the pages after the first are consumed in order:
+    up to `lookahead` pages beyond the current one are kept in flight.
+    """
+
+    def __init__(self, total_pages, lookahead):
+        self.total_pages = total_pages
+        self.lookahead = lookahead
+        self.next_page = 2
+
+    def __iter__(self):
+        return iter(range(2, self.total_pages + 1))
+
+    def due(self, page_number):
+        """Pages to request now that `page_number` is the one being waited for"""
+        last = min(page_number + self.lookahead, self.total_pages)
+        due = range(self.next_page, last + 1)
+        self.next_page = max(self.next_page, last + 1)
+        return due
+
+
+def _quota_stops_pagination(error, page_number):
+    print(f"[WARNING] {error}; ranking the {page_number - 1} pages already fetched")
+
+
+def iter_hotel_pages(city_name, start_date, end_date, adults, lookahead=HOTEL_PAGE_LOOKAHEAD):
+    """
+    Yields each results page (a list of compact hotel records) in page order as it arrives.
+    Up to `lookahead` further pages are requested while the consumer works on the current one;
+    closing the generator stops pagination. Ends at the first empty or failed page, or when the
+    hotels quota runs out after the first page (a QuotaError before that is raised).
+    """
+    dest = get_destination_data(city_name)
+    page_args = (dest["dest_id"], start_date, end_date, adults)
+
+    # The first page tells us how many pages there are
+    first = _page_or_empty(*page_args, 1)
+    if not first["hotels"]:
+        return
+    yield first["hotels"]
+
+    schedule = _PageSchedule(first["total_pages"], lookahead)
+    pending = {}
+    try:
+        for page_number in schedule:
+            for page in schedule.due(page_number):
+                pending[page] = hotel_page_executor.submit(propagate(_page_or_empty), *page_args, page)
+            try:
+                hotels = pending.pop(page_number).result()["hotels"]
+            except QuotaError as e:
+                _quota_stops_pagination(e, page_number)
+                return
+            if not hotels:
+                return
+            yield hotels
+    finally:
+        for future in pending.values():
+            future.cancel()
+
+
+async def aiter_hotel_pages(city_name, start_date, end_date, adults, lookahead=HOTEL_PAGE_LOOKAHEAD):
+    """
+    Async counterpart of iter_hotel_pages.
+    """
+    dest = await async_get_destination_data(city_name)
+    page_args = (dest["dest_id"], start_date, end_date, adults)
+
+    first = await _async_page_or_empty(*page_args, 1)
+    if not first["hotels"]:
+        return
+    yield first["hotels"]
+
+    schedule = _PageSchedule(first["total_pages"], lookahead)
+    pending = {}
+    try:
+        for page_number in schedule:
+            for page in schedule.due(page_number):
+                pending[page] = asyncio.ensure_future(_async_page_or_empty(*page_args, page))
+            try:
+                hotels = (await pending.pop(page_number))["hotels"]
+            except QuotaError as e:
+                _quota_stops_pagination(e, page_number)
+                return
+            if not hotels:
+                return
+            yield hotels
+    finally:
+        for task in pending.values():
+            task.cancel()
+
+
+def _stay_price(prop):
+    price_info = prop["priceBreakdown"]
+    return round(price_info["grossPrice"]["value"] + price_info["excludedPrice"]["value"])
+
+
+def _nights(start_date, end_date):
+    try:
+        days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days
+    except (TypeError, ValueError):
+        return 1
+    return max(days, 1)
+
+
+def _nightly_target(budget, nights):
+    """Nightly accommodation budget (HOTEL_BUDGET_SHARE of the trip budget), or 0 without a budget"""
+    try:
+        return max(float(budget) * HOTEL_BUDGET_SHARE / nights, 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _numbers(hotels, field):
+    values = []
+    for hotel in hotels:
+        try:
+            values.append(float(hotel.get(field)))
+        except (TypeError, ValueError):
+            values.append(np.nan)
+    return np.array(values, dtype=float)
+
+
+class HotelCollector:
+    """
+    Consumer of the page stream: accumulates hotels and tells when enough of them qualify
+    (within the nightly budget and reviewed at least HOTEL_MIN_REVIEW_SCORE) to stop paginating.
+    """
+
+    def __init__(self, budget=None, nights=1, top_k=HOTEL_TOP_K):
+        self.hotels = []
+        self.qualifying = 0
+        self.nights = nights
+        self.nightly_target = _nightly_target(budget, nights)
+        # top_k=0 asks for every hotel, so never stop early then
+        self.enough = (HOTEL_ENOUGH_CANDIDATES or 2 * top_k) if top_k else 0
+
+    def _qualifies(self, hotel):
+        try:
+            if float(hotel.get("reviewScore")) < HOTEL_MIN_REVIEW_SCORE:
+                return False
+        except (TypeError, ValueError):
+            return False
+        return not self.nightly_target or hotel["price"] / self.nights <= self.nightly_target
+
+    def add(self, page):
+        self.hotels.extend(page)
+        self.qualifying += sum(1 for hotel in page if self._qualifies(hotel))
+
+    def is_satisfied(self):
+        return bool(self.enough) and self.qualifying >= self.enough
+
+
+def score_hotels(hotels, budget=None, nights=1, centroid=None):
+    """
+    Scores compact hotel records in one vectorized pass; higher is better.
+    Combines price per night against the nightly accommodation budget, reviewScore,
+    reviewCount, accuratePropertyClass and distance to `centroid` ({"lat", "lng"}).
+    Signals that can't be computed (no budget, no centroid) are left out of the weighting.
+    """
+    if not hotels:
+        return np.array([])
+
+    scores = {}
+    price_per_night = np.array([hotel["price"] for hotel in hotels], dtype=float) / nights
+    nightly_target = _nightly_target(budget, nights)
+    if nightly_target > 0:
+        # 1.0 for free, 0.7 at the target, falling to 0 at 1.7x the target
+        ratio = price_per_night / nightly_target
+        scores["price"] = np.where(ratio <= 1, 1 - 0.3 * ratio, np.clip(1.7 - ratio, 0, 1))
+    else:
+        # No budget: prefer cheaper hotels relative to this result set
+        spread = np.ptp(price_per_night) or 1.0
+        scores["price"] = 1 - (price_per_night - price_per_night.min()) / spread
+
+    scores["review"] = np.nan_to_num(_numbers(hotels, "reviewScore") / 10, nan=0.5)
+    review_count = np.log1p(np.nan_to_num(_numbers(hotels, "reviewCount"), nan=0.0))
+    scores["review_count"] = review_count / (review_count.max() or 1.0)
+    scores["stars"] = np.nan_to_num(_numbers(hotels, "accuratePropertyClass") / 5, nan=0.4)
+
+    if centroid:
+        distance = haversine_km(_numbers(hotels, "latitude"), _numbers(hotels, "longitude"),
+                                centroid["lat"], centroid["lng"])
+        scores["distance"] = np.nan_to_num(np.exp(-distance / 5), nan=0.0)
+
+    total_weight = sum(HOTEL_RANK_WEIGHTS[name] for name in scores)
+    return sum(scores[name] * HOTEL_RANK_WEIGHTS[name] for name in scores) / total_weight
+
+
+def rank_hotels(hotels, budget=None, nights=1, centroid=None, top_k=HOTEL_TOP_K):
+    """
+    Returns the `top_k` best hotels with their scores, best first (all of them if top_k is 0).
+    """
+    scores = score_hotels(hotels, budget=budget, nights=nights, centroid=centroid)
+    order = np.argsort(-scores, kind="stable")
+    if top_k:
+        order = order[:top_k]
+    return [(hotels[i], float(scores[i])) for i in order]
+
+
+def _or_na(value):
+    return "N/A" if value is None else value
+
+
+def _hotel_record(hotel, nights=1, score=None):
+    record = {
+        "name": hotel["name"],
+        "rating": f'{_or_na(hotel["accuratePropertyClass"])} out of 5',
+        "review_score": f'{_or_na(hotel["reviewScore"])} ({hotel["reviewScoreWord"]})',
+        "review_count": _or_na(hotel["reviewCount"]),
+        "checkin": hotel["checkin"],
+        "checkout": hotel["checkout"],
+        "price(incl_taxes)": hotel["price"],
+        "price_per_night": round(hotel["price"] / nights),
+        "free_cancellation": "YES" if hotel["free_cancellation"] else "NO",
+        "no_prepayment": "YES" if hotel["no_prepayment"] else "NO",
+        "photo": hotel["photo"] or "No image",
+        "longitude": _or_na(hotel["longitude"]),
+        "latitude": _or_na(hotel["latitude"])
+    }
+    if score is not None:
+        record["score"] = round(score, 3)
+    return record
+
+
+def _city_centroid(city_name):
+    try:
+        return get_coordinates(city_name)
+    except Exception as e:
+        print(f"[WARNING] No coordinates for {city_name}, ranking hotels without distance: {e}")
+        return None
+
+
+def _ranked_records(collector, budget, top_k, centroid, attractions):
+    """The collected hotels ranked, cut to top_k and given their nearest attractions"""
+    print(f"Total hotels collected: {len(collector.hotels)}")
+    ranked = rank_hotels(collector.hotels, budget=budget, nights=collector.nights, centroid=centroid, top_k=top_k)
+    records = [_hotel_record(hotel, collector.nights, score) for hotel, score in ranked]
+    return attach_nearby_attractions(records, attractions)
+
+
+def _destination_attractions(city_name):
+    try:
+        return get_attractions(city_name)
+    except Exception as e:
+        print(f"[WARNING] No attractions for {city_name}, skipping nearby landmarks: {e}")
+        return []
+
+
+@timed("service.hotels")
+@single_flight()
+def parse_hotel_info(city_name, start_date, end_date, adults, budget=None, top_k=HOTEL_TOP_K):
+    """
+    Hotels for the stay, ranked by score_hotels and cut to the best `top_k`,
+    each with its nearest attractions. Result pages are consumed as they arrive and
+    pagination stops once enough hotels qualify. Returns a degraded result when the
+    hotels quota leaves no room for the search.
+    """
+    collector = HotelCollector(budget, _nights(start_date, end_date), top_k)
+
+    # Coordinates and attractions are usually cached; look them up while the hotel pages load
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        centroid = executor.submit(propagate(_city_centroid), city_name)
+        attractions = executor.submit(propagate(_destination_attractions), city_name)
+        try:
+            with contextlib.closing(iter_hotel_pages(city_name, start_date, end_date, adults)) as pages:
+                for page in pages:
+                    collector.add(page)
+                    if collector.is_satisfied():
+                        break
+        except QuotaError as e:
+            return degraded_result(e)
+
+    return _ranked_records(collector, budget, top_k, centroid.result(), attractions.result())
+
+
+async def _async_collect_hotels(collector, city_name, start_date, end_date, adults):
+    async with contextlib.aclosing(aiter_hotel_pages(city_name, start_date, end_date, adults)) as pages:
+        async for page in pages:
+            collector.add(page)
+            if collector.is_satisfied():
+                break
+    return collector.hotels
+
+
+@timed("service.hotels")
+@single_flight(endpoint="hotel_service.parse_hotel_info")
+async def async_parse_hotel_info(city_name, start_date, end_date, adults, budget=None, top_k=HOTEL_TOP_K):
+    collector = HotelCollector(budget, _nights(start_date, end_date), top_k)
+    try:
+        _, centroid, attractions = await asyncio.gather(
+            _async_collect_hotels(collector, city_name, start_date, end_date, adults),
+            asyncio.to_thread(_city_centroid, city_name),
+            asyncio.to_thread(_destination_attractions, city_name),
+        )
+    except QuotaError as e:
+        return degraded_result(e)
+    return _ranked_records(collector, budget, top_k, centroid, attractions)
@@ -0,0 +1,389 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from services.circuit_breaker import CircuitOpenError, breaker_for
+    from services.metrics import CIRCUIT_REJECTIONS, HTTP_HEDGES, observe_upstream, propagate, record_failure
+    from services.quota import QuotaError, areserve, reserve, try_reserve
+except ImportError:
+    from circuit_breaker import CircuitOpenError, breaker_for
+    from metrics import CIRCUIT_REJECTIONS, HTTP_HEDGES, observe_upstream, propagate, record_failure
+    from quota import QuotaError, areserve, reserve, try_reserve
+
+# Number of hosts to keep connection pools for, and keep-alive connections kept per host
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+# A 429/503 asking to be retried later than this is returned as it is instead of holding the caller
+HTTP_MAX_RETRY_AFTER = float(os.getenv("HTTP_MAX_RETRY_AFTER", "10"))
+
+# Hedging: a GET still unanswered after the host's recent p95 latency is sent a second time and
+# the first answer wins. Needs HTTP_HEDGE_MIN_SAMPLES recent calls to know the p95, and at most
+# HTTP_HEDGE_MAX_FRACTION of a host's calls are duplicated, so a uniformly slow host isn't hit twice as hard.
+# The second copy is a metered call like the first: it is only sent if the provider's quota has a token free now
+HTTP_HEDGE_ENABLED = os.getenv("HTTP_HEDGE_ENABLED", "1") == "1"
+HTTP_HEDGE_MIN_SAMPLES = int(os.getenv("HTTP_HEDGE_MIN_SAMPLES", "20"))
+HTTP_HEDGE_WINDOW = int(os.getenv("HTTP_HEDGE_WINDOW", "200"))
+HTTP_HEDGE_MIN_DELAY = float(os.getenv("HTTP_HEDGE_MIN_DELAY", "0.05"))
+HTTP_HEDGE_MAX_FRACTION = float(os.getenv("HTTP_HEDGE_MAX_FRACTION", "0.05"))
+HTTP_HEDGE_MAX_WORKERS = int(os.getenv("HTTP_HEDGE_MAX_WORKERS", "64"))
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _build_adapter(pool_maxsize=HTTP_POOL_MAXSIZE):
+    # Retries are made by _get_with_retries, which reserves quota for each one
+    return HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize,
+        pool_block=False,
+        max_retries=0,
+    )
+
+
+# One adapter (and so one set of per-host pools) for the whole process.
+# Each thread gets its own Session mounted on it, because Session objects aren't
+# guaranteed thread-safe while the urllib3 pools underneath them are.
+_adapters = {"https://": _build_adapter(), "http://": _build_adapter()}
+_adapters_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure_host(base_url, pool_maxsize):
+    """
+    Gives `base_url` (e.g. "https://irctc1.p.rapidapi.com") its own pool size.
+    Call at startup, before the first request.
+    """
+    with _adapters_lock:
+        _adapters[base_url] = _build_adapter(pool_maxsize)
+
+
+# e.g. HTTP_HOST_POOL_SIZES="irctc1.p.rapidapi.com=8,weather.googleapis.com=16"
+for _item in filter(None, os.getenv("HTTP_HOST_POOL_SIZES", "").split(",")):
+    _host, _size = _item.split("=")
+    configure_host(f"https://{_host.strip()}", int(_size))
+
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None or getattr(_local, "mounted", None) != len(_adapters):
+        session = requests.Session()
+        with _adapters_lock:
+            for prefix, adapter in _adapters.items():
+                session.mount(prefix, adapter)
+            _local.mounted = len(_adapters)
+        _local.session = session
+    return session
+
+
+class _LatencyWindow:
+    """Recent successful call latencies of one host, and its hedge budget"""
+
+    def __init__(self, size=HTTP_HEDGE_WINDOW):
+        self.samples = deque(maxlen=size)
+        self.calls = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def hedge_delay(self):
+        """The host's p95 latency, or None while there are too few samples to hedge"""
+        with self._lock:
+            self.calls += 1
+            if len(self.samples) < HTTP_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return max(ordered[int(0.95 * (len(ordered) - 1))], HTTP_HEDGE_MIN_DELAY)
+
+    def take_hedge(self):
+        with self._lock:
+            if self.hedges >= self.calls * HTTP_HEDGE_MAX_FRACTION:
+                return False
+            self.hedges += 1
+            return True
+
+
+_latencies = {}
+_latencies_lock = threading.Lock()
+hedge_executor = ThreadPoolExecutor(max_workers=HTTP_HEDGE_MAX_WORKERS, thread_name_prefix="http-hedge")
+
+
+def _latency_window(host):
+    window = _latencies.get(host)
+    if window is None:
+        with _latencies_lock:
+            window = _latencies.setdefault(host, _LatencyWindow())
+    return window
+
+
+def _admit(host):
+    """The host's breaker and latency window; raises CircuitOpenError if its circuit is open"""
+    breaker = breaker_for(host)
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        CIRCUIT_REJECTIONS.inc(host=host)
+        record_failure(host)
+        raise
+    return breaker, _latency_window(host)
+
+
+def _record(host, breaker, window, status, seconds):
+    # status is the response code, or the exception class name if the call failed
+    ok = isinstance(status, int) and status < 500
+    breaker.record(ok, seconds)
+    if ok:
+        window.add(seconds)
+    observe_upstream(host, status, seconds)
+
+
+class _Call:
+    """
+    One logical request to `host`: admitted by the host's circuit breaker on creation (or
+    CircuitOpenError), and its latency and outcome recorded when the `with` block ends.
+    `hedge_delay` is how long to wait before hedging it, or None if it isn't hedged.
+    """
+
+    def __init__(self, host, hedge):
+        self.host = host
+        self.breaker, self.window = _admit(host)
+        self.hedge_delay = self.window.hedge_delay() if hedge and HTTP_HEDGE_ENABLED else None
+        self.status = "error"
+        self._started = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if isinstance(exc, Exception):
+            self.status = exc_type.__name__
+        _record(self.host, self.breaker, self.window, self.status, time.perf_counter() - self._started)
+        return False
+
+
+def _take_hedge(window, quota):
+    # The hedge is skipped rather than waited for when the provider has no token free
+    return window.take_hedge() and (not quota or try_reserve(*quota))
+
+
+def _guarded(host, send, hedge, quota):
+    """
+    Runs send() (one request to `host`, retries included) behind the host's circuit breaker,
+    hedged if asked, and records its latency and outcome.
+    """
+    with _Call(host, hedge) as call:
+        if call.hedge_delay is None:
+            response = send()
+        else:
+            response = _hedged(host, send, call.hedge_delay, call.window, quota)
+        call.status = response.status_code
+        return response
+
+
+def _hedged(host, send, delay, window, quota):
+    send = propagate(send)
+    primary = hedge_executor.submit(send)
+    done, _ = wait([primary], timeout=delay)
+    if done or not _take_hedge(window, quota):
+        return primary.result()
+
+    backup = hedge_executor.submit(send)
+    errors = []
+    # The slower copy finishes in the background and is dropped
+    for future in as_completed((primary, backup)):
+        try:
+            response = future.result()
+        except Exception as e:
+            errors.append(e)
+            continue
+        HTTP_HEDGES.inc(host=host, winner="primary" if future is primary else "hedge")
+        return response
+    raise errors[0]
+
+
+def _retry_delay(attempt, response):
+    """
+    Seconds to back off before retrying a failed attempt (response None: it raised a transport error),
+    or None when it shouldn't be retried.
+    """
+    if attempt >= HTTP_MAX_RETRIES or (response is not None and response.status_code not in RETRY_STATUSES):
+        return None
+    delay = HTTP_BACKOFF_FACTOR * (2 ** attempt)
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        if int(retry_after) > HTTP_MAX_RETRY_AFTER:
+            return None
+        delay = max(delay, int(retry_after))
+    return delay
+
+
+def _reserve_retry(quota):
+    """Reserves a retry from `quota` ((provider, api_key) or None); False when the provider has no capacity"""
+    try:
+        if quota:
+            reserve(*quota)
+        return True
+    except QuotaError:
+        return False
+
+
+async def _areserve_retry(quota):
+    try:
+        if quota:
+            await areserve(*quota)
+        return True
+    except QuotaError:
+        return False
+
+
+def _get_with_retries(url, params, headers, timeout, quota, **kwargs):
+    """
+    One GET with retries on 429/5xx and connection errors. The caller reserved the first attempt;
+    each retry reserves its own call, and without capacity the last response or error is returned.
+    """
+    attempt = 0
+    while True:
+        response = error = None
+        try:
+            response = get_session().get(url, params=params, headers=headers, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        delay = _retry_delay(attempt, response)
+        if delay is not None:
+            time.sleep(delay)
+        if delay is None or not _reserve_retry(quota):
+            if error is not None:
+                raise error
+            return response
+        attempt += 1
+
+
+def get(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT, hedge=True, quota=None, **kwargs):
+    """
+    requests.get over the shared keep-alive pools, with default timeouts and retries on 429/5xx.
+    With quota=(provider, api_key) every attempt, retries included, is reserved from that provider's
+    quota first; QuotaError is raised if the first one can't be. Fails fast with CircuitOpenError
+    while the host's circuit is open. Slow calls are hedged unless hedge=False (only for
+    idempotent requests, which every GET here is), each copy reserving its own quota.
+    """
+    if quota:
+        reserve(*quota)
+    return _guarded(
+        urlsplit(url).netloc,
+        lambda: _get_with_retries(url, params, headers, timeout, quota, **kwargs),
+        hedge,
+        quota,
+    )
+
+
+# Async clients are bound to the event loop they were created on, so keep one per loop. Weak keys
+# let a finished loop (e.g. each asyncio.run) be collected together with its client
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Shared httpx.AsyncClient for the running event loop, with the same pool size and timeouts.
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        # Loops that are closed but still referenced somewhere can't use their clients any more
+        for stale in [other for other in list(_async_clients.keys()) if other.is_closed()]:
+            _async_clients.pop(stale, None)
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_MAXSIZE * HTTP_POOL_CONNECTIONS,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def aget(url, params=None, headers=None, hedge=True, quota=None, **kwargs):
+    """
+    Async counterpart of get(): same timeouts, retries with backoff on 429/5xx and connection errors,
+    quota reservation, circuit breaking and hedging.
+    """
+    if quota:
+        await areserve(*quota)
+    client = get_async_client()
+    host = urlsplit(url).netloc
+    with _Call(host, hedge) as call:
+        send = lambda: _aget_with_retries(client, url, params, headers, quota, **kwargs)  # noqa: E731
+        if call.hedge_delay is None:
+            response = await send()
+        else:
+            response = await _ahedged(host, send, call.hedge_delay, call.window, quota)
+        call.status = response.status_code
+        return response
+
+
+async def _ahedged(host, send, delay, window, quota):
+    tasks = [asyncio.ensure_future(send())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not await asyncio.to_thread(_take_hedge, window, quota):
+            return await tasks[0]
+
+        tasks.append(asyncio.ensure_future(send()))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    HTTP_HEDGES.inc(host=host, winner="primary" if task is tasks[0] else "hedge")
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        # Unlike threads, the slower copy can be cancelled
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def _aget_with_retries(client, url, params, headers, quota, **kwargs):
+    import httpx
+
+    attempt = 0
+    while True:
+        response = error = None
+        try:
+            response = await client.get(url, params=params, headers=headers, **kwargs)
+        except httpx.TransportError as e:
+            error = e
+        delay = _retry_delay(attempt, response)
+        if delay is not None:
+            await asyncio.sleep(delay)
+        if delay is None or not await _areserve_retry(quota):
+            if error is not None:
+                raise error
+            return response
+        attempt += 1
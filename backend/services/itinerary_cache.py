@@ -0,0 +1,94 @@
+import json
+import math
+import os
+
+try:
+    from services.cache import CACHE_DB_PATH, CACHE_TTLS, ResponseCache, make_key
+    from services.code_index import normalize
+    from services.metrics import current_request
+except ImportError:
+    from cache import CACHE_DB_PATH, CACHE_TTLS, ResponseCache, make_key
+    from code_index import normalize
+    from metrics import current_request
+
+ITINERARY_CACHE_ITEMS = int(os.getenv("ITINERARY_CACHE_ITEMS", "256"))
+# Memory cap of the in-process tier; itineraries are a few KB of markdown each
+ITINERARY_CACHE_MAX_BYTES = int(os.getenv("ITINERARY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Budgets within roughly this fraction of each other share a cached itinerary
+ITINERARY_BUDGET_STEP = float(os.getenv("ITINERARY_BUDGET_STEP", "0.1"))
+
+# Replies the agent gives when it ran out of iterations or time; never worth caching
+_INCOMPLETE_REPLIES = ("Agent stopped",)
+
+itinerary_cache = ResponseCache(
+    db_path=CACHE_DB_PATH, max_items=ITINERARY_CACHE_ITEMS, max_bytes=ITINERARY_CACHE_MAX_BYTES
+)
+
+
+def budget_bucket(budget):
+    """
+    Log-scale bucket of a budget: each bucket spans about ITINERARY_BUDGET_STEP of its value.
+    """
+    try:
+        budget = float(budget)
+    except (TypeError, ValueError):
+        return None
+    if budget <= 0:
+        return None
+    return round(math.log(budget) / math.log1p(ITINERARY_BUDGET_STEP))
+
+
+def itinerary_key(details, mode):
+    """Cache key of an itinerary: normalized cities, dates, travellers, budget bucket and planner mode"""
+    return make_key(
+        "itinerary",
+        normalize(details.get("from_city") or ""),
+        normalize(details.get("to_city") or ""),
+        str(details.get("start_date")),
+        str(details.get("end_date")),
+        str(details.get("adults")),
+        budget_bucket(details.get("budget")),
+        mode,
+    )
+
+
+def get_cached_itinerary(details, mode):
+    """The cached itinerary for these trip details, or None"""
+    hit, reply = itinerary_cache.get(itinerary_key(details, mode), "itinerary")
+    return reply if hit else None
+
+
+def _tool_failed(result):
+    # The tools return plain text only when they fail (weather is JSON text when it succeeds)
+    if isinstance(result, str):
+        try:
+            result = json.loads(result)
+        except ValueError:
+            return True
+    return isinstance(result, dict) and ("error" in result or bool(result.get("degraded")))
+
+
+def prefetch_succeeded(prefetched):
+    """
+    True if every prefetched tool result is real data: no failure or timeout message, no error or
+    degraded result, and no provider call of the current request failed or was refused (services
+    swallow some of those into empty results, e.g. a hotel page or flight search that got a 503).
+    """
+    if any(_tool_failed(result) for result in prefetched.values()):
+        return False
+    timings = current_request()
+    return timings is None or not timings.failures
+
+
+def store_itinerary(details, mode, reply, prefetched):
+    """
+    Caches a finished itinerary for CACHE_TTLS["itinerary"] seconds. Empty or cut-off replies, and
+    itineraries written from incomplete provider data (see prefetch_succeeded), are skipped.
+    Call it inside the request's metrics.request_timings() so failed provider calls are seen.
+    """
+    if not reply or not reply.strip() or reply.startswith(_INCOMPLETE_REPLIES):
+        return
+    if not prefetch_succeeded(prefetched):
+        print("[INFO] Not caching an itinerary built from incomplete provider data")
+        return
+    itinerary_cache.set(itinerary_key(details, mode), reply, CACHE_TTLS["itinerary"], "itinerary")
@@ -0,0 +1,49 @@
+import threading
+
+try:
+    from services.metrics import llm_callback_handler
+except ImportError:
+    from metrics import llm_callback_handler
+
+_clients = {}
+_lock = threading.Lock()
+# Builds a chat model from (model, **options); None means ChatGoogleGenerativeAI
+_factory = None
+
+
+def set_llm_factory(factory):
+    """
+    Replaces how chat models are built, e.g. with a deterministic fake for benchmarks.
+    Clients built so far are dropped; pass None to go back to Gemini.
+    """
+    global _factory
+    with _lock:
+        _factory = factory
+        _clients.clear()
+
+
+def get_llm(model, temperature=None, **kwargs):
+    """
+    Process-wide ChatGoogleGenerativeAI client for a model/temperature/options combination.
+    Clients are created once and reused, so their HTTP/gRPC channels stay warm.
+    """
+    key = (model, temperature, tuple(sorted(kwargs.items())))
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                options = dict(kwargs)
+                if temperature is not None:
+                    options["temperature"] = temperature
+                # Times every call and counts its tokens for /metrics
+                options.setdefault("callbacks", [llm_callback_handler()])
+                if _factory is not None:
+                    client = _factory(model=model, **options)
+                else:
+                    # Imported on first use: the Gemini SDK adds about a second to startup
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+
+                    client = ChatGoogleGenerativeAI(model=model, **options)
+                _clients[key] = client
+    return client
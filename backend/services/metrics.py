@@ -0,0 +1,382 @@
+"""
+Timing spans, LLM token counts and Prometheus-format export.
+
+Every span is observed into a process-wide histogram. Inside request_timings() the spans are
+also collected for that one request, so /chat can return its own breakdown. Work handed to a
+thread pool only reports into the request if it is submitted through propagate().
+"""
+import bisect
+import contextlib
+import contextvars
+import functools
+import inspect
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histograms; a /chat can take minutes, an HTTP call milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+ITERATION_BUCKETS = (1, 2, 3, 4, 6, 8, 10, 12, 15)
+
+# Gemini's rule of thumb, used when a response carries no usage metadata
+_CHARS_PER_TOKEN = 4
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label combination"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _format_number(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Monotonic counter with one series per label combination"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(key)} {_format_number(value)}" for key, value in values)
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram(
+    "trip_mitra_stage_seconds", "Time spent in each stage of a request (service calls, LLM calls, waits)", ("stage",))
+UPSTREAM_SECONDS = Histogram(
+    "trip_mitra_upstream_request_seconds", "Provider HTTP request latency", ("host", "status"))
+LLM_SECONDS = Histogram("trip_mitra_llm_call_seconds", "LLM call latency", ("model",))
+LLM_TOKENS = Histogram(
+    "trip_mitra_llm_tokens", "Prompt and completion tokens per LLM call (estimated when the provider reports none)",
+    ("model", "kind"), buckets=TOKEN_BUCKETS)
+LLM_TOKENS_TOTAL = Counter("trip_mitra_llm_tokens_total", "Prompt and completion tokens", ("model", "kind"))
+AGENT_ITERATIONS = Histogram(
+    "trip_mitra_agent_iterations", "ReAct iterations per agent run", buckets=ITERATION_BUCKETS)
+HTTP_HEDGES = Counter(
+    "trip_mitra_http_hedges_total", "Hedged provider requests, by which copy answered first", ("host", "winner"))
+CIRCUIT_REJECTIONS = Counter(
+    "trip_mitra_circuit_rejections_total", "Provider calls refused because the host's circuit was open", ("host",))
+
+REGISTRY = [
+    STAGE_SECONDS, UPSTREAM_SECONDS, LLM_SECONDS, LLM_TOKENS, LLM_TOKENS_TOTAL, AGENT_ITERATIONS,
+    HTTP_HEDGES, CIRCUIT_REJECTIONS,
+]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class RequestTimings:
+    """Spans and token counts of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._tokens = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_tokens(self, kind, tokens):
+        with self._lock:
+            self._tokens[kind] = self._tokens.get(kind, 0) + tokens
+
+    def add_failure(self, source):
+        with self._lock:
+            self._failures[source] = self._failures.get(source, 0) + 1
+
+    @property
+    def failures(self):
+        """Provider calls of this request that failed or were refused, per host or quota"""
+        with self._lock:
+            return dict(self._failures)
+
+    def breakdown(self):
+        """Total time plus count and summed time per stage (concurrent spans overlap, so stages can add up to more)"""
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "stages": {
+                    stage: {"count": count, "total_ms": round(seconds * 1000, 1)}
+                    for stage, (count, seconds) in sorted(self._stages.items())
+                },
+                "llm_tokens": dict(self._tokens),
+                "upstream_failures": dict(self._failures),
+            }
+
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextlib.contextmanager
+def request_timings():
+    """Collects the spans of everything run inside the block (and in work submitted via propagate())"""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def current_request():
+    """The RequestTimings of the request being handled, or None outside request_timings()"""
+    return _current.get()
+
+
+def propagate(func):
+    """
+    `func` bound to a copy of the caller's context, for executor.submit/map.
+    Each call gets its own copy, so the wrapper can run on several threads at once.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return run
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current.get()
+    if timings is not None:
+        timings.add_stage(stage, seconds)
+
+
+@contextlib.contextmanager
+def span(stage):
+    """Times the block as `stage`, whether it returns or raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def timed(stage):
+    """Decorator form of span() for sync and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_failure(source):
+    """A provider call of the current request failed or was refused (by a circuit breaker or quota)"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add_failure(source)
+
+
+def observe_upstream(host, status, seconds):
+    """One provider HTTP request; status is the response code or the exception class name"""
+    UPSTREAM_SECONDS.observe(seconds, host=host, status=status)
+    observe_stage(f"http.{host}", seconds)
+    if not isinstance(status, int) or status >= 500 or status == 429:
+        record_failure(host)
+
+
+def observe_llm_call(model, seconds, prompt_tokens, completion_tokens):
+    LLM_SECONDS.observe(seconds, model=model)
+    observe_stage(f"llm.{model}", seconds)
+    timings = _current.get()
+    for kind, tokens in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+        LLM_TOKENS.observe(tokens, model=model, kind=kind)
+        LLM_TOKENS_TOTAL.inc(tokens, model=model, kind=kind)
+        if timings is not None:
+            timings.add_tokens(kind, tokens)
+
+
+def estimate_tokens(text):
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+def _reported_usage(response):
+    """(prompt, completion) tokens if the LLM result carries usage metadata, else None"""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if "prompt_tokens" in usage:
+        return usage["prompt_tokens"], usage.get("completion_tokens", 0)
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            metadata = getattr(message, "usage_metadata", None) or \
+                getattr(message, "response_metadata", {}).get("usage_metadata")
+            if metadata:
+                if "input_tokens" in metadata:
+                    return metadata["input_tokens"], metadata.get("output_tokens", 0)
+                return metadata.get("prompt_token_count", 0), metadata.get("candidates_token_count", 0)
+    return None
+
+
+_callback_handler = None
+_callback_lock = threading.Lock()
+
+
+def llm_callback_handler():
+    """
+    LangChain callback handler (one per process) that times LLM calls, counts their tokens and
+    times ReAct iterations. Attach it to chat models and the agent executor at construction.
+    """
+    global _callback_handler
+    if _callback_handler is None:
+        with _callback_lock:
+            if _callback_handler is None:
+                _callback_handler = _build_callback_handler()
+    return _callback_handler
+
+
+def _build_callback_handler():
+    # Defined on first use so importing this module doesn't pull in LangChain
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        # Called in the request's own thread/task, so request_timings() sees these spans
+        run_inline = True
+
+        def __init__(self):
+            # run id -> (model, start time, estimated prompt tokens) of LLM calls in flight
+            self._llm_runs = {}
+            # run id of an agent executor -> [iterations, time of the last step]
+            self._agent_runs = {}
+            self._lock = threading.Lock()
+
+        def _start_llm(self, run_id, serialized, prompt_text, invocation_params):
+            model = (invocation_params or {}).get("model") or \
+                (serialized or {}).get("kwargs", {}).get("model") or "unknown"
+            with self._lock:
+                self._llm_runs[run_id] = (str(model), time.perf_counter(), estimate_tokens(prompt_text))
+
+        def on_llm_start(self, serialized, prompts, *, run_id, invocation_params=None, **kwargs):
+            self._start_llm(run_id, serialized, "".join(prompts), invocation_params)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, invocation_params=None, **kwargs):
+            text = "".join(str(message.content) for batch in messages for message in batch)
+            self._start_llm(run_id, serialized, text, invocation_params)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            with self._lock:
+                run = self._llm_runs.pop(run_id, None)
+            if run is None:
+                return
+            model, started, prompt_estimate = run
+            usage = _reported_usage(response)
+            if usage is None:
+                completion = "".join(g.text for generations in response.generations for g in generations)
+                usage = (prompt_estimate, estimate_tokens(completion))
+            observe_llm_call(model, time.perf_counter() - started, *usage)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            with self._lock:
+                run = self._llm_runs.pop(run_id, None)
+            if run is not None:
+                observe_stage(f"llm.{run[0]}.error", time.perf_counter() - run[1])
+
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+            # Only the executor itself (the outermost chain the handler is attached to) is tracked
+            if parent_run_id is None:
+                with self._lock:
+                    self._agent_runs[run_id] = [0, time.perf_counter()]
+
+        def _step(self, run_id):
+            with self._lock:
+                run = self._agent_runs.get(run_id)
+                if run is None:
+                    return
+                now = time.perf_counter()
+                run[0] += 1
+                seconds, run[1] = now - run[1], now
+            observe_stage("agent.iteration", seconds)
+
+        def on_agent_action(self, action, *, run_id, **kwargs):
+            self._step(run_id)
+
+        def on_agent_finish(self, finish, *, run_id, **kwargs):
+            self._step(run_id)
+
+        def _end_chain(self, run_id):
+            with self._lock:
+                run = self._agent_runs.pop(run_id, None)
+            if run is not None:
+                AGENT_ITERATIONS.observe(run[0])
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._end_chain(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._end_chain(run_id)
+
+    return MetricsCallbackHandler()
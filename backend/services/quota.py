@@ -0,0 +1,220 @@
+"""
+Provider quotas shared by every worker process on the host.
+
+Each (provider, API key) pair gets a token bucket plus a daily call budget stored in SQLite,
+so all workers draw from the same allowance. Services reserve a call before making it:
+when the bucket is empty the caller queues for up to QUOTA_MAX_WAIT seconds, and once the
+daily budget is spent reservations fail immediately. Both failures raise a QuotaError, which
+the services turn into a degraded result instead of spending a call the provider would refuse.
+"""
+import asyncio
+import contextlib
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date
+
+try:
+    from services.metrics import observe_stage, record_failure
+except ImportError:
+    from metrics import observe_stage, record_failure
+
+# Shared by every worker process on the host; set QUOTA_DB_PATH="" to keep the buckets per process
+QUOTA_DB_PATH = os.getenv("QUOTA_DB_PATH", os.path.join(tempfile.gettempdir(), "trip_mitra_quota.sqlite3"))
+# Longest a call queues for capacity before giving up
+QUOTA_MAX_WAIT = float(os.getenv("QUOTA_MAX_WAIT", "10"))
+
+
+class Quota:
+    """`rate` calls per second (bursts of up to `burst`) and at most `daily` calls per day (0 = no limit)"""
+
+    def __init__(self, rate, burst=None, daily=0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.daily = int(daily)
+
+
+def _quota_from_env(prefix, default_rps):
+    # e.g. HOTELS_API_RPS, HOTELS_API_BURST, HOTELS_DAILY_QUOTA
+    burst = os.getenv(f"{prefix}_API_BURST")
+    return Quota(
+        rate=float(os.getenv(f"{prefix}_API_RPS", default_rps)),
+        burst=float(burst) if burst else None,
+        daily=int(os.getenv(f"{prefix}_DAILY_QUOTA", "0")),
+    )
+
+
+QUOTAS = {
+    "hotels": _quota_from_env("HOTELS", "2"),
+    "flights": _quota_from_env("FLIGHTS", "10"),
+    "trains": _quota_from_env("IRCTC", "5"),
+    # Places and Weather both bill the GOOGLE_API_KEY
+    "google": _quota_from_env("GOOGLE", "10"),
+}
+
+
+class QuotaError(RuntimeError):
+    """No capacity for a call to `provider`"""
+
+    def __init__(self, provider, message):
+        super().__init__(message)
+        self.provider = provider
+
+
+class QuotaExhausted(QuotaError):
+    """The provider's daily budget is spent"""
+
+
+class QuotaTimeout(QuotaError):
+    """Capacity didn't free up within QUOTA_MAX_WAIT"""
+
+
+def degraded_result(error):
+    """What a service returns instead of data when its provider has no quota left"""
+    return {"error": f"{error} - data unavailable", "degraded": True, "provider": error.provider}
+
+
+def _bucket_name(provider, api_key):
+    # Keys are never stored; workers using the same key find the same bucket by its fingerprint
+    fingerprint = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+    return f"{provider}:{fingerprint}"
+
+
+class QuotaManager:
+    """
+    Token buckets and daily counters in a SQLite file; each reservation is one IMMEDIATE
+    transaction, so concurrent processes never hand out the same token.
+    """
+
+    def __init__(self, db_path=QUOTA_DB_PATH, quotas=None, max_wait=QUOTA_MAX_WAIT):
+        self.db_path = db_path or ":memory:"
+        self.quotas = QUOTAS if quotas is None else quotas
+        self.max_wait = max_wait
+        self._conn = None
+        # One connection per process; the lock also makes the in-memory fallback thread-safe
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Caller holds self._lock
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+            if self.db_path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS quota_buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL, updated REAL, day TEXT, used INTEGER)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _take(self, provider, api_key):
+        """
+        Takes one call from the bucket. Returns 0 on success, or the seconds until a token frees up.
+        Raises QuotaExhausted once the daily budget is spent.
+        """
+        quota = self.quotas[provider]
+        name = _bucket_name(provider, api_key)
+        now, today = time.time(), date.today().isoformat()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated, day, used FROM quota_buckets WHERE name = ?", (name,)
+                ).fetchone()
+                tokens, updated, day, used = row or (quota.burst, now, today, 0)
+                tokens = min(quota.burst, tokens + max(now - updated, 0.0) * quota.rate)
+                if day != today:
+                    day, used = today, 0
+
+                exhausted = bool(quota.daily) and used >= quota.daily
+                wait = 0.0
+                if not exhausted:
+                    if tokens >= 1:
+                        tokens -= 1
+                        used += 1
+                    else:
+                        wait = (1 - tokens) / quota.rate
+                conn.execute(
+                    "INSERT OR REPLACE INTO quota_buckets (name, tokens, updated, day, used) VALUES (?, ?, ?, ?, ?)",
+                    (name, tokens, now, day, used),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if exhausted:
+            raise QuotaExhausted(provider, f"Daily {provider} quota of {quota.daily} calls is used up")
+        return wait
+
+    @contextlib.contextmanager
+    def _reserving(self, provider):
+        """Times a reservation as the "quota.<provider>" stage and counts it as a failure if it raises"""
+        started = time.monotonic()
+        try:
+            yield started
+        except QuotaError:
+            record_failure(f"quota.{provider}")
+            raise
+        finally:
+            observe_stage(f"quota.{provider}", time.monotonic() - started)
+
+    def _check_wait(self, provider, wait, started):
+        """The wait for the next token, or QuotaTimeout if it would run past max_wait"""
+        if wait > started + self.max_wait - time.monotonic():
+            raise QuotaTimeout(provider, f"No {provider} capacity within {self.max_wait:.0f}s")
+        return wait
+
+    def reserve(self, provider, api_key):
+        """Blocks until a call to `provider` may be made with `api_key`, or raises a QuotaError"""
+        with self._reserving(provider) as started:
+            while True:
+                wait = self._take(provider, api_key)
+                if not wait:
+                    return
+                time.sleep(self._check_wait(provider, wait, started))
+
+    async def areserve(self, provider, api_key):
+        """Like reserve(), but waits on the event loop"""
+        with self._reserving(provider) as started:
+            while True:
+                # _take holds a lock around a SQLite transaction, so it runs off the event loop
+                wait = await asyncio.to_thread(self._take, provider, api_key)
+                if not wait:
+                    return
+                await asyncio.sleep(self._check_wait(provider, wait, started))
+
+    def try_reserve(self, provider, api_key):
+        """Takes a call only if one is free right now; never waits and never raises a QuotaError"""
+        try:
+            return not self._take(provider, api_key)
+        except QuotaError:
+            return False
+
+    def usage(self):
+        """Calls made today and tokens left per bucket (as of each bucket's last reservation)"""
+        today = date.today().isoformat()
+        with self._lock:
+            rows = self._connect().execute("SELECT name, tokens, day, used FROM quota_buckets").fetchall()
+        usage = {}
+        for name, tokens, day, used in rows:
+            provider = name.split(":", 1)[0]
+            quota = self.quotas.get(provider)
+            usage[name] = {
+                "used_today": used if day == today else 0,
+                "daily_limit": quota.daily if quota else None,
+                "tokens": round(tokens, 2),
+            }
+        return usage
+
+
+quota_manager = QuotaManager()
+reserve = quota_manager.reserve
+areserve = quota_manager.areserve
+try_reserve = quota_manager.try_reserve
@@ -0,0 +1,181 @@
+"""
+Single-flight request coalescing: concurrent calls with the same normalized arguments
+share one upstream fetch instead of each hitting the provider.
+
+Within a process, followers wait for the leader's result. With SINGLE_FLIGHT_LOCK_DIR set,
+leaders in different worker processes also take a file lock for the key, so the second process
+runs only after the first has finished and finds the provider responses in the shared cache.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import os
+import threading
+import time
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays per process
+    fcntl = None
+
+try:
+    from services.cache import make_key
+except ImportError:
+    from cache import make_key
+
+# Directory for cross-process lock files; empty disables cross-process coalescing
+SINGLE_FLIGHT_LOCK_DIR = os.getenv("SINGLE_FLIGHT_LOCK_DIR", "")
+# Longest a process waits for another process's fetch before fetching anyway
+SINGLE_FLIGHT_LOCK_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT", "120"))
+# Keys share this many lock files, so the directory stays the same size however many keys there are;
+# two keys landing on the same file only take turns
+SINGLE_FLIGHT_LOCK_SLOTS = int(os.getenv("SINGLE_FLIGHT_LOCK_SLOTS", "256"))
+_LOCK_POLL_SECONDS = 0.05
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def stats():
+    """Leader/follower counters per coalesced function"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _FileLock:
+    """Exclusive flock on the key's slot lock file, acquired by polling so it can time out"""
+
+    def __init__(self, key, lock_dir=SINGLE_FLIGHT_LOCK_DIR):
+        self.path = None
+        self._fd = None
+        if lock_dir and fcntl is not None:
+            os.makedirs(lock_dir, exist_ok=True)
+            # sha256 rather than hash(), which differs between processes
+            slot = int(hashlib.sha256(key.encode("utf-8")).hexdigest(), 16) % max(SINGLE_FLIGHT_LOCK_SLOTS, 1)
+            self.path = os.path.join(lock_dir, f"slot-{slot:03d}.lock")
+
+    def _try_lock(self):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def acquire(self):
+        if self.path is None:
+            return
+        deadline = time.monotonic() + SINGLE_FLIGHT_LOCK_TIMEOUT
+        while not self._try_lock() and time.monotonic() < deadline:
+            time.sleep(_LOCK_POLL_SECONDS)
+
+    async def acquire_async(self):
+        if self.path is None:
+            return
+        deadline = time.monotonic() + SINGLE_FLIGHT_LOCK_TIMEOUT
+        while not self._try_lock() and time.monotonic() < deadline:
+            await asyncio.sleep(_LOCK_POLL_SECONDS)
+
+    def release(self):
+        # Closing the descriptor drops the lock (or gives up on it after a timeout)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def single_flight(endpoint=None):
+    """
+    Coalesces concurrent calls of a service function (sync or async) with equal arguments.
+    Arguments are bound to the signature (defaults applied) and normalized like cache keys,
+    so positional and keyword spellings of the same call share one fetch.
+    Every waiting caller gets the same result object (or exception), so treat results as read-only.
+    """
+    def decorator(func):
+        name = endpoint or f"{func.__module__.split('.')[-1]}.{func.__name__}"
+        signature = inspect.signature(func)
+
+        def key_for(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return make_key(name, **bound.arguments)
+
+        if inspect.iscoroutinefunction(func):
+            # (event loop, key) -> task of the leading call
+            tasks = {}
+
+            async def lead(key, args, kwargs):
+                file_lock = _FileLock(key)
+                try:
+                    await file_lock.acquire_async()
+                    return await func(*args, **kwargs)
+                finally:
+                    file_lock.release()
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = key_for(args, kwargs)
+                slot = (asyncio.get_running_loop(), key)
+                task = tasks.get(slot)
+                if task is None:
+                    _count(f"{name}.leaders")
+                    task = asyncio.ensure_future(lead(key, args, kwargs))
+                    tasks[slot] = task
+                    task.add_done_callback(lambda _: tasks.pop(slot, None))
+                else:
+                    _count(f"{name}.coalesced")
+                # Shielded so one caller being cancelled doesn't cancel the fetch for the others
+                return await asyncio.shield(task)
+
+            return async_wrapper
+
+        calls = {}
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_for(args, kwargs)
+            with lock:
+                call = calls.get(key)
+                leader = call is None
+                if leader:
+                    call = calls[key] = _Call()
+
+            if not leader:
+                _count(f"{name}.coalesced")
+                call.done.wait()
+                if call.error is not None:
+                    raise call.error
+                return call.value
+
+            _count(f"{name}.leaders")
+            file_lock = _FileLock(key)
+            try:
+                file_lock.acquire()
+                call.value = func(*args, **kwargs)
+                return call.value
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                file_lock.release()
+                with lock:
+                    calls.pop(key, None)
+                call.done.set()
+
+        return wrapper
+    return decorator
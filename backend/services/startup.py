@@ -0,0 +1,113 @@
+"""
+Startup behaviour and import-cost budget.
+
+LangChain, the Gemini SDK and the Sarvam SDK are imported on first use, so the app
+answers its health route right after the process starts. STARTUP_MODE chooses when they load:
+  "lazy"       - on the first request that needs them (default)
+  "background" - in a daemon thread right after startup, while requests are already served
+  "eager"      - before the app starts serving
+
+Check the import cost of a module with:  python -m services.startup [module]
+"""
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+STARTUP_MODES = ("lazy", "background", "eager")
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")
+# Budget for importing the web app module, in milliseconds
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "800"))
+
+# SDKs that are deferred at import time and loaded by warm_up()
+HEAVY_MODULES = ("langchain.agents", "langchain.tools", "langchain_google_genai", "sarvamai")
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def warm_up():
+    """
+    Imports the heavy SDKs and builds the shared planner LLM and agent.
+    Returns the seconds spent on each step.
+    """
+    try:
+        from services.gemini_agent import get_agent, get_planner_llm
+    except ImportError:
+        from gemini_agent import get_agent, get_planner_llm
+
+    timings = {}
+    for module in HEAVY_MODULES:
+        start = time.perf_counter()
+        __import__(module)
+        timings[module] = time.perf_counter() - start
+    for name, build in (("planner_llm", get_planner_llm), ("agent", get_agent)):
+        start = time.perf_counter()
+        build()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def _warm_up_logged():
+    try:
+        timings = warm_up()
+        print(f"[INFO] Warm-up finished in {sum(timings.values()):.2f}s")
+    except Exception as e:
+        print(f"[WARNING] Warm-up failed: {e}")
+
+
+def start(mode=None):
+    """
+    Applies the startup mode; call once the app object exists.
+    """
+    mode = mode or STARTUP_MODE
+    if mode not in STARTUP_MODES:
+        raise ValueError(f"Unknown startup mode '{mode}'. Choose one of: {', '.join(STARTUP_MODES)}")
+    if mode == "eager":
+        _warm_up_logged()
+    elif mode == "background":
+        threading.Thread(target=_warm_up_logged, name="warm-up", daemon=True).start()
+    return mode
+
+
+def import_report(module="app"):
+    """
+    Imports `module` in a fresh interpreter with -X importtime.
+    Returns (total_ms, [(cumulative_ms, self_ms, depth, module_name)]) in import order.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((int(cumulative_us) / 1000, int(self_us) / 1000, len(indent) // 2, name))
+    total_ms = next((e[0] for e in reversed(entries) if e[3] == module), 0.0)
+    return total_ms, entries
+
+
+def check_import_budget(module="app", budget_ms=IMPORT_BUDGET_MS, top=15):
+    """
+    Prints the most expensive imports of `module` (as seen from the top two levels of its import tree)
+    and returns True if importing it stays within `budget_ms`.
+    """
+    total_ms, entries = import_report(module)
+    print(f"import {module}: {total_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    shallow = sorted((e for e in entries if e[2] <= 1 and e[3] != module), reverse=True)
+    for cumulative_ms, self_ms, _, name in shallow[:top]:
+        print(f"{cumulative_ms:>14.1f} {self_ms:>9.1f}  {name}")
+    return total_ms <= budget_ms
+
+
+if __name__ == "__main__":
+    ok = check_import_budget(sys.argv[1] if len(sys.argv) > 1 else "app")
+    sys.exit(0 if ok else 1)
@@ -1,33 +1,75 @@
-import requests
+import asyncio
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+
+try:
+    from services import http_client
+    from services.cache import cached
+    from services.single_flight import single_flight
+    from services.metrics import timed, propagate
+    from services.quota import QuotaError, degraded_result
+    from services.code_index import station_index, resolve_code
+    from services.llm_registry import get_llm
+    from services.travel_dates import date_window, iso_date
+except ImportError:
+    import http_client
+    from cache import cached
+    from single_flight import single_flight
+    from metrics import timed, propagate
+    from quota import QuotaError, degraded_result
+    from code_index import station_index, resolve_code
+    from llm_registry import get_llm
+    from travel_dates import date_window, iso_date
+
 load_dotenv()
 IRCTC_API_KEY = os.getenv("IRCTC_API_KEY")
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
+# Overridable so benchmarks and tests can point the service at a local stand-in
+IRCTC_API_BASE_URL = os.getenv("IRCTC_API_BASE_URL", "https://irctc1.p.rapidapi.com")
+# Flexible-date search: also search this many days before and after each travel date (0 = exact dates)
+TRAIN_FLEX_DAYS = int(os.getenv("TRAIN_FLEX_DAYS", "0"))
+TRAIN_SEARCH_MAX_WORKERS = int(os.getenv("TRAIN_SEARCH_MAX_WORKERS", "8"))
 
-def get_station_code(city_name):
+# Runs the per-date lookups of one search (both directions) concurrently
+train_search_executor = ThreadPoolExecutor(max_workers=TRAIN_SEARCH_MAX_WORKERS, thread_name_prefix="trains")
+
+def ask_llm_for_station_code(city_name):
     prompt = f"What is the main IRCTC station code for {city_name}? Return only the code."
-    response = llm.invoke(prompt)
+    response = get_llm("gemini-2.0-flash").invoke(prompt)
     return response.content.strip().upper()
 
 
-def get_train_details(from_station, to_station, date_of_journey):
-    url = "https://irctc1.p.rapidapi.com/api/v3/trainBetweenStations"
-    headers = {
-        "x-rapidapi-host": "irctc1.p.rapidapi.com",
-        "x-rapidapi-key": IRCTC_API_KEY
-    }
-    params = {
-        "fromStationCode": from_station,
-        "toStationCode": to_station,
-        "dateOfJourney": date_of_journey
+def get_station_code(city_name):
+    """
+    Looks up the main IRCTC station code for a city in the bundled index.
+    Unknown cities fall back to Gemini and the answer is remembered.
+    """
+    code = resolve_code(station_index, "stations", city_name, ask_llm_for_station_code)
+    if not code:
+        raise ValueError(f"No station code found for {city_name}")
+    return code
+
+
+def _train_request(from_station, to_station, date_of_journey):
+    """Keyword arguments for http_client.get/aget"""
+    return {
+        "url": f"{IRCTC_API_BASE_URL}/api/v3/trainBetweenStations",
+        "headers": {
+            "x-rapidapi-host": "irctc1.p.rapidapi.com",
+            "x-rapidapi-key": IRCTC_API_KEY
+        },
+        "params": {
+            "fromStationCode": from_station,
+            "toStationCode": to_station,
+            "dateOfJourney": date_of_journey
+        },
+        "quota": ("trains", IRCTC_API_KEY),
     }
 
-    res = requests.get(url, headers=headers, params=params)
-    res.raise_for_status()
-    data = res.json()
 
+def _parse_trains(response):
+    response.raise_for_status()
+    data = response.json()
     if not data.get("status") or "data" not in data:
         return []
 
@@ -44,18 +86,128 @@ def get_train_details(from_station, to_station, date_of_journey):
     return trains
 
 
-def get_trains_to_and_from_city(from_city, to_city, start_date, end_date):
+@cached("trains")
+def get_train_details(from_station, to_station, date_of_journey):
+    return _parse_trains(http_client.get(**_train_request(from_station, to_station, date_of_journey)))
+
+
+@cached("trains", endpoint="train_service.get_train_details")
+async def async_get_train_details(from_station, to_station, date_of_journey):
+    return _parse_trains(await http_client.aget(**_train_request(from_station, to_station, date_of_journey)))
+
+
+def _search_dates(start_date, end_date, flex_days):
+    """The travel dates as YYYY-MM-DD and the flex window (default TRAIN_FLEX_DAYS)"""
+    return iso_date(start_date), iso_date(end_date), TRAIN_FLEX_DAYS if flex_days is None else flex_days
+
+
+def _search_plan(from_station, to_station, start_date, end_date, flex_days):
+    """Every (leg, from, to, date) lookup a search needs"""
+    return [
+        (leg, origin, destination, day)
+        for leg, origin, destination, travel_date in (
+            ("outbound", from_station, to_station, start_date),
+            ("return", to_station, from_station, end_date),
+        )
+        for day in date_window(travel_date, flex_days)
+    ]
+
+
+def _minutes(clock):
+    """'HH:MM' -> minutes, or None"""
     try:
-        from_station = get_station_code(from_city)
-        to_station = get_station_code(to_city)
+        hours, minutes = str(clock).split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except (TypeError, ValueError):
+        return None
 
-        trains_to = get_train_details(from_station, to_station, start_date)
-        trains_from = get_train_details(to_station, from_station, end_date)
 
-        return {
-            to_city: {"from": from_city, "to": to_city, "trains": trains_to},
-            from_city: {"from": to_city, "to": from_city, "trains": trains_from}
+def _day_summary(trains):
+    """Count, earliest departure, shortest duration and classes offered by one day's trains"""
+    if isinstance(trains, Exception):
+        return {"error": str(trains)}
+    departures = [t["departure_time"] for t in trains if _minutes(t["departure_time"]) is not None]
+    durations = [t["duration"] for t in trains if _minutes(t["duration"]) is not None]
+    return {
+        "count": len(trains),
+        "earliest_departure": min(departures, key=_minutes, default=None),
+        "shortest_duration": min(durations, key=_minutes, default=None),
+        "classes": sorted({c for t in trains for c in t["classes"] or []}),
+    }
+
+
+def _assemble_search(from_city, to_city, start_date, end_date, plan, results, flex_days):
+    by_day = {(leg, day): trains for (leg, _, _, day), trains in zip(plan, results)}
+    trains_to, trains_from = by_day[("outbound", start_date)], by_day[("return", end_date)]
+    # The requested dates must succeed; nearby dates are best effort
+    for trains in (trains_to, trains_from):
+        if isinstance(trains, Exception):
+            raise trains
+
+    result = {
+        to_city: {"from": from_city, "to": to_city, "trains": trains_to},
+        from_city: {"from": to_city, "to": from_city, "trains": trains_from}
+    }
+    if flex_days:
+        result["daily_summary"] = {
+            leg: {day: _day_summary(trains) for (trip_leg, day), trains in by_day.items() if trip_leg == leg}
+            for leg in ("outbound", "return")
         }
+    return result
+
+
+def _search_error(error):
+    return degraded_result(error) if isinstance(error, QuotaError) else {"error": str(error)}
+
+
+def _get_train_details_or_error(from_station, to_station, date_of_journey):
+    try:
+        return get_train_details(from_station, to_station, date_of_journey)
+    except Exception as e:
+        return e
+
+
+@timed("service.trains")
+@single_flight()
+def get_trains_to_and_from_city(from_city, to_city, start_date, end_date, flex_days=None):
+    """
+    Trains for both directions of a trip, all dates looked up concurrently.
+    With flex_days (default TRAIN_FLEX_DAYS), every date within ±flex_days of the travel dates is
+    searched too and a per-day "daily_summary" (count, earliest departure, shortest duration, classes)
+    is returned alongside the full lists for the requested dates.
+    """
+    try:
+        start_date, end_date, flex_days = _search_dates(start_date, end_date, flex_days)
+        from_station = get_station_code(from_city)
+        to_station = get_station_code(to_city)
+
+        plan = _search_plan(from_station, to_station, start_date, end_date, flex_days)
+        results = list(train_search_executor.map(
+            propagate(lambda lookup: _get_train_details_or_error(*lookup[1:])), plan
+        ))
+        return _assemble_search(from_city, to_city, start_date, end_date, plan, results, flex_days)
     except Exception as e:
-        return {"error": str(e)}
+        return _search_error(e)
+
 
+@timed("service.trains")
+@single_flight(endpoint="train_service.get_trains_to_and_from_city")
+async def async_get_trains_to_and_from_city(from_city, to_city, start_date, end_date, flex_days=None):
+    """
+    Async counterpart of get_trains_to_and_from_city.
+    """
+    try:
+        start_date, end_date, flex_days = _search_dates(start_date, end_date, flex_days)
+        # Station lookups are local; only unknown cities reach the (blocking) LLM fallback
+        from_station, to_station = await asyncio.gather(
+            asyncio.to_thread(get_station_code, from_city),
+            asyncio.to_thread(get_station_code, to_city),
+        )
+
+        plan = _search_plan(from_station, to_station, start_date, end_date, flex_days)
+        results = await asyncio.gather(
+            *(async_get_train_details(*lookup[1:]) for lookup in plan), return_exceptions=True
+        )
+        return _assemble_search(from_city, to_city, start_date, end_date, plan, results, flex_days)
+    except Exception as e:
+        return _search_error(e)
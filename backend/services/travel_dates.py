@@ -0,0 +1,14 @@
+from datetime import datetime, timedelta
+
+
+def iso_date(value):
+    """A travel date as "YYYY-MM-DD" (e.g. "2025-11-8" -> "2025-11-08"); raises ValueError if it isn't one"""
+    return datetime.strptime(str(value), "%Y-%m-%d").date().isoformat()
+
+
+def date_window(travel_date, flex_days):
+    """The travel date plus the days within ±flex_days of it that aren't in the past"""
+    center = datetime.strptime(travel_date, "%Y-%m-%d").date()
+    today = datetime.now().date()
+    days = {center + timedelta(days=offset) for offset in range(-flex_days, flex_days + 1)}
+    return sorted({travel_date} | {day.isoformat() for day in days if day >= today})
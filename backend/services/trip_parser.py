@@ -0,0 +1,352 @@
+"""
+Rule-based extraction of trip parameters from formulaic chat messages
+("Delhi to Goa 3 days 2 adults budget 20000"), so most requests skip the extraction LLM call.
+"""
+import json
+import re
+from datetime import date, timedelta
+
+try:
+    from services.code_index import DATA_FILE as CODES_FILE, normalize
+    from services.geocode import DESTINATIONS_FILE
+except ImportError:
+    from code_index import DATA_FILE as CODES_FILE, normalize
+    from geocode import DESTINATIONS_FILE
+
+# Same defaults the extraction prompt asks the LLM to apply
+DEFAULT_ADULTS = 2
+DEFAULT_BUDGET = 10000
+DEFAULT_TRIP_DAYS = 3
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+WEEKDAYS = {"monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6}
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+
+# Word right before a city that tells which end of the trip it is
+_FROM_MARKERS = {"from", "leaving", "departing", "starting"}
+_TO_MARKERS = {"to", "visit", "visiting", "in", "for", "towards", "explore", "reach", "into"}
+# Markers that only count when no other city is marked: "I am in Delhi and want to go to Goa"
+_WEAK_MARKERS = {"in"}
+
+_NUM = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+_MONTH_NAMES = (
+    "january", "february", "march", "april", "may", "june", "july", "august", "september",
+    "october", "november", "december", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sept", "sep",
+    "oct", "nov", "dec",
+)
+_MONTH = r"(" + "|".join(_MONTH_NAMES) + r")\b\.?"
+_ORD = r"(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s*(\d{4}))?"
+
+_DATE_RANGE = re.compile(rf"\b(\d{{1,2}}){_ORD}\s*(?:-|to|till|until)\s*(\d{{1,2}}){_ORD}\s+(?:of\s+)?{_MONTH}{_YEAR}")
+_DATE_PATTERNS = (
+    (re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"), "ymd"),
+    (re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})\b"), "dmy"),
+    # Day first, as written in India: 12/11 is 12 November
+    (re.compile(r"\b(\d{1,2})/(\d{1,2})\b"), "dm"),
+    (re.compile(rf"\b(\d{{1,2}}){_ORD}\s+(?:of\s+)?{_MONTH}{_YEAR}"), "d_month"),
+    (re.compile(rf"\b{_MONTH}\s+(\d{{1,2}}){_ORD}\b{_YEAR}"), "month_d"),
+)
+_DAY_AFTER_TOMORROW = re.compile(r"\bday after tomorrow\b")
+_TOMORROW = re.compile(r"\btomorrow\b")
+_TODAY = re.compile(r"\b(?:today|tonight)\b")
+_IN_DAYS = re.compile(rf"\b(?:in|after)\s+{_NUM}\s+(day|week)s?\b")
+_WEEKDAY = re.compile(r"\b(?:(next|this|on|coming)\s+)?(" + "|".join(WEEKDAYS) + r")\b")
+_WEEKEND = re.compile(r"\b(?:this|next|coming)?\s*weekend\b")
+_NEXT_WEEK = re.compile(r"\bnext week\b")
+_DURATION = re.compile(rf"\b{_NUM}\s*-?\s*(day|night|week)s?\b")
+
+_ADULTS = re.compile(rf"\b{_NUM}\s+(?:adults?|people|persons?|pax|travell?ers|members|guests|of us)\b")
+_GROUP = re.compile(rf"\b(?:family of|group of|we are|party of)\s+{_NUM}\b")
+_WITH_FRIENDS = re.compile(rf"\b(?:me\s+)?(?:and|with)\s+{_NUM}\s+(?:friends|others)\b")
+_COUPLE = re.compile(r"\b(?:couple|honeymoon|my (?:wife|husband|partner|girlfriend|boyfriend))\b")
+_SOLO = re.compile(r"\b(?:solo|alone|by myself|just me)\b")
+
+_AMOUNT = r"(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|lakhs?|lacs?|l)?\b"
+# Anchored at a word start (digits may touch it, as in "5000rs") so "hours 5" isn't read as "rs 5"
+_CURRENCY = r"(?:₹|(?<![a-z])(?:rs\.?|inr|rupees))"
+# Amounts quoted per night or per person ("hotel under 5000 per night") aren't the trip's budget
+_NOT_PER_UNIT = r"(?!\s*(?:/-\s*)?(?:/|per|a|each)?\s*(?:night|nite|pp|person|head|day)\b)"
+_BUDGET_PATTERNS = (
+    re.compile(rf"\bbudget\s*(?:of|is|:|around|about|under|below|upto|up to|within|max|of around)?\s*{_CURRENCY}?\s*{_AMOUNT}{_NOT_PER_UNIT}"),
+    re.compile(rf"{_CURRENCY}\s*{_AMOUNT}{_NOT_PER_UNIT}"),
+    re.compile(rf"\b(?:under|below|within|upto|up to|max)\s+(\d[\d,]{{3,}}(?:\.\d+)?)\s*(k|thousand|lakhs?|lacs?|l)?\b{_NOT_PER_UNIT}"),
+    re.compile(rf"\b{_AMOUNT}\s*(?:{_CURRENCY}|/-){_NOT_PER_UNIT}"),
+    re.compile(rf"\b(\d+(?:\.\d+)?)\s*(k|lakhs?|lacs?)\b{_NOT_PER_UNIT}"),
+)
+_MULTIPLIERS = {"k": 1000, "thousand": 1000, "l": 100000, "lakh": 100000, "lakhs": 100000, "lac": 100000, "lacs": 100000}
+
+# Date-like words that, if left unparsed, mean the rules probably missed something
+# ("may" is left out: it is far more often a verb than a month)
+_LEFTOVER_DATE_HINTS = re.compile(
+    r"\b(?:" + "|".join(m for m in _MONTH_NAMES if m != "may") + "|" + "|".join(WEEKDAYS) + r")\b"
+    r"|\b\d{1,2}(?:st|nd|rd|th)\b"
+    # Numeric dates none of the date patterns understood, e.g. 12-11
+    r"|\b\d{1,2}[/.-]\d{1,2}\b"
+)
+# Relative times and events the rules can't turn into a date ("in 2 months", "after Diwali")
+_LEFTOVER_TIME_HINTS = re.compile(
+    r"\b(?:months?|fortnight|year end|new year|weeks? (?:from now|later)|later this)\b"
+    r"|\b(?:diwali|deepavali|holi|dussehra|dasara|navratri|durga puja|christmas|xmas|eid|pongal|onam"
+    r"|sankranti|ganesh chaturthi|raksha bandhan|independence day|republic day|easter)\b"
+    r"|\b(?:summer|winter|puja|diwali|christmas) (?:vacation|holidays?|break)\b"
+    r"|\b(?:after|before|during) (?:my |the |our )?(?:exams?|results?|wedding|vacation|holidays?)\b"
+)
+# A number of two or more digits nothing above consumed, e.g. a bare "25000" that may be the budget
+_LEFTOVER_NUMBER = re.compile(r"\d{2,}")
+
+
+def _load_gazetteer():
+    """
+    Normalized place name -> display name, for every destination, alias and station/airport city we know.
+    """
+    with open(DESTINATIONS_FILE, encoding="utf-8") as f:
+        destinations = json.load(f)
+    with open(CODES_FILE, encoding="utf-8") as f:
+        codes = json.load(f)
+
+    gazetteer = {}
+    for kind in ("airports", "stations"):
+        for entry in codes[kind]:
+            for city in entry["cities"]:
+                gazetteer.setdefault(normalize(city), city)
+    for name in destinations:
+        gazetteer[normalize(name)] = name
+    # Aliases keep the user's wording (the services resolve them to codes and coordinates themselves);
+    # some, like Manali -> Kullu, only point at the nearest airport and must not rename the destination
+    for alias in codes["aliases"]:
+        gazetteer.setdefault(normalize(alias), alias)
+    return gazetteer
+
+
+GAZETTEER = _load_gazetteer()
+_MAX_NAME_WORDS = max(len(name.split()) for name in GAZETTEER)
+
+
+def _number(text):
+    return NUMBER_WORDS.get(text) or int(text)
+
+
+def _find_cities(message):
+    """
+    Known places in order of appearance, as (display name, role) with role "from", "to" or None.
+    """
+    words = normalize(message).split()
+    found = []
+    i = 0
+    while i < len(words):
+        for n in range(min(_MAX_NAME_WORDS, len(words) - i), 0, -1):
+            name = GAZETTEER.get(" ".join(words[i:i + n]))
+            if name:
+                previous = words[i - 1] if i else ""
+                role = "from" if previous in _FROM_MARKERS else "to" if previous in _TO_MARKERS else None
+                if all(name != city for city, _, _ in found):
+                    found.append((name, role, previous in _WEAK_MARKERS))
+                i += n
+                break
+        else:
+            i += 1
+    if any(role and not weak for _, role, weak in found):
+        # Another city has a real marker, so "in" just says where someone is (or stays)
+        return [(name, None if weak else role) for name, role, weak in found]
+    return [(name, role) for name, role, _ in found]
+
+
+def _assign_cities(found):
+    from_city = next((city for city, role in found if role == "from"), None)
+    to_city = next((city for city, role in found if role == "to" and city != from_city), None)
+    unassigned = [city for city, role in found if city not in (from_city, to_city)]
+    if from_city is None and to_city is not None and unassigned:
+        from_city = unassigned.pop(0)
+    elif to_city is None and from_city is not None and unassigned:
+        to_city = unassigned.pop(0)
+    elif from_city is None and to_city is None:
+        if len(unassigned) >= 2:
+            from_city, to_city = unassigned[0], unassigned[1]
+        elif unassigned:
+            # A single unmarked place is most likely where the user wants to go
+            to_city = unassigned[0]
+    return from_city, to_city
+
+
+def _make_date(year, month, day, today):
+    try:
+        if year is None:
+            value = date(today.year, month, day)
+            return value if value >= today else date(today.year + 1, month, day)
+        year = int(year)
+        return date(year + 2000 if year < 100 else year, month, day)
+    except ValueError:
+        return None
+
+
+class _Text:
+    """Lowercased message whose parsed spans are blanked out as they are consumed"""
+
+    def __init__(self, message):
+        self.value = f" {message.lower()} "
+
+    def take(self, pattern):
+        matches = list(pattern.finditer(self.value))
+        for match in matches:
+            start, end = match.span()
+            self.value = self.value[:start] + " " * (end - start) + self.value[end:]
+        return matches
+
+
+def _explicit_dates(text, today):
+    dates = []
+    for match in text.take(_DATE_RANGE):
+        first, last, month, year = match.groups()
+        month = MONTHS[month[:3]]
+        dates.append((match.start(), _make_date(year, month, int(first), today)))
+        dates.append((match.start() + 1, _make_date(year, month, int(last), today)))
+
+    for pattern, layout in _DATE_PATTERNS:
+        for match in text.take(pattern):
+            groups = match.groups()
+            if layout == "ymd":
+                value = _make_date(groups[0], int(groups[1]), int(groups[2]), today)
+            elif layout == "dmy":
+                value = _make_date(groups[2], int(groups[1]), int(groups[0]), today)
+            elif layout == "dm":
+                value = _make_date(None, int(groups[1]), int(groups[0]), today)
+            elif layout == "d_month":
+                value = _make_date(groups[2], MONTHS[groups[1][:3]], int(groups[0]), today)
+            else:
+                value = _make_date(groups[2], MONTHS[groups[0][:3]], int(groups[1]), today)
+            dates.append((match.start(), value))
+    return [value for _, value in sorted(dates, key=lambda d: d[0])]
+
+
+def _relative_start(text, today):
+    """Start date from words like "tomorrow" or "next Friday"; also returns an implied end date for weekends"""
+    if text.take(_DAY_AFTER_TOMORROW):
+        return today + timedelta(days=2), None
+    if text.take(_TOMORROW):
+        return today + timedelta(days=1), None
+    if text.take(_TODAY):
+        return today, None
+    matches = text.take(_IN_DAYS)
+    if matches:
+        count, unit = _number(matches[0].group(1)), matches[0].group(2)
+        return today + timedelta(days=count * (7 if unit == "week" else 1)), None
+    matches = text.take(_WEEKEND)
+    if matches:
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7 or 7)
+        return saturday, saturday + timedelta(days=1)
+    if text.take(_NEXT_WEEK):
+        return today + timedelta(days=7 - today.weekday()), None
+    matches = text.take(_WEEKDAY)
+    if matches:
+        weekday = WEEKDAYS[matches[0].group(2)]
+        return today + timedelta(days=(weekday - today.weekday()) % 7 or 7), None
+    return None, None
+
+
+def _duration(text):
+    """Trip length as (days between start and end date) or None"""
+    matches = text.take(_DURATION)
+    if not matches:
+        return None
+    count, unit = _number(matches[0].group(1)), matches[0].group(2)
+    if unit == "week":
+        return 7 * count
+    # "3 nights" checks out 3 days later; "3 days" ends on the third day
+    return count if unit == "night" else max(count - 1, 0)
+
+
+def _adults(text):
+    for pattern, extra in ((_ADULTS, 0), (_GROUP, 0), (_WITH_FRIENDS, 1)):
+        matches = text.take(pattern)
+        if matches:
+            return _number(matches[0].group(1)) + extra
+    if text.take(_COUPLE):
+        return 2
+    if text.take(_SOLO):
+        return 1
+    return None
+
+
+def _budget(text):
+    for pattern in _BUDGET_PATTERNS:
+        matches = text.take(pattern)
+        if matches:
+            amount, unit = matches[0].group(1), matches[0].group(2)
+            return int(float(amount.replace(",", "")) * _MULTIPLIERS.get(unit or "", 1))
+    return None
+
+
+def parse_trip_message(message, today=None):
+    """
+    Extracts from_city, to_city, start_date, end_date (YYYY-MM-DD), adults and budget with rules only.
+    Returns (details, confidence); confidence is 0..1 and low when the message needs the LLM.
+    """
+    today = today or date.today()
+    text = _Text(message)
+    confidence = 1.0
+
+    found = _find_cities(message)
+    from_city, to_city = _assign_cities(found)
+    if to_city is None:
+        confidence = 0.0
+    if from_city is None:
+        confidence -= 0.4
+    if len(found) > 2:
+        confidence -= 0.3
+
+    budget = _budget(text)
+    adults = _adults(text)
+    dates = _explicit_dates(text, today)
+    relative_start, relative_end = _relative_start(text, today)
+    duration = _duration(text)
+
+    if None in dates:
+        confidence -= 0.5
+        dates = [d for d in dates if d]
+    if len(dates) > 2:
+        confidence -= 0.3
+
+    start = dates[0] if dates else relative_start
+    if start is None:
+        start = today + timedelta(days=1)
+        confidence -= 0.05
+
+    if len(dates) >= 2:
+        end = dates[1]
+    elif duration is not None:
+        end = start + timedelta(days=duration)
+    elif relative_end is not None:
+        end = relative_end
+    else:
+        end = start + timedelta(days=DEFAULT_TRIP_DAYS - 1)
+        confidence -= 0.15
+
+    if end < start or (end - start).days > 60:
+        confidence -= 0.5
+    if adults is not None and not 1 <= adults <= 30:
+        confidence -= 0.3
+    if budget is not None and budget < 500:
+        confidence -= 0.3
+    # Unparsed date or time words mean the dates above are probably wrong; leave those to the LLM
+    if _LEFTOVER_DATE_HINTS.search(text.value) or _LEFTOVER_TIME_HINTS.search(text.value):
+        confidence -= 0.3
+    # Same for numbers: a bare or per-night amount shouldn't quietly become DEFAULT_BUDGET
+    if _LEFTOVER_NUMBER.search(text.value):
+        confidence -= 0.3
+
+    details = {
+        "from_city": from_city,
+        "to_city": to_city,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "adults": adults if adults is not None else DEFAULT_ADULTS,
+        "budget": budget if budget is not None else DEFAULT_BUDGET,
+    }
+    return details, round(max(confidence, 0.0), 2)
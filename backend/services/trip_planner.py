@@ -0,0 +1,302 @@
+import json
+import os
+
+try:
+    from services.gemini_agent import bind_trip, format_prefetched_data, get_agent, get_planner_llm
+    from services.llm_registry import get_llm
+    from services.metrics import timed
+    from services.trip_parser import parse_trip_message
+except ImportError:
+    from gemini_agent import bind_trip, format_prefetched_data, get_agent, get_planner_llm
+    from llm_registry import get_llm
+    from metrics import timed
+    from trip_parser import parse_trip_message
+
+# "agent": the ReAct agent writes the itinerary (tools return the prefetched data).
+# "single_pass": one generation call with the prefetched data embedded in the prompt.
+PLANNER_MODES = ("agent", "single_pass")
+PLANNER_MODE = os.getenv("PLANNER_MODE", "agent")
+# Rule-based extraction results at or above this confidence skip the extraction LLM (set above 1 to always ask it)
+EXTRACTION_MIN_CONFIDENCE = float(os.getenv("EXTRACTION_MIN_CONFIDENCE", "0.75"))
+
+
+class TripExtractionError(ValueError):
+    """Raised when the extraction LLM doesn't return valid JSON"""
+
+    def __init__(self, message, raw_output):
+        super().__init__(message)
+        self.raw_output = raw_output
+
+
+def _extraction_prompt(message):
+    return f"""
+    Extract the following details from this message:
+    - from_city
+    - to_city
+    - start_date (Date of tomorrow if not mentioned, format: YYYY-MM-DD)
+    - end_date (format: YYYY-MM-DD)
+    - adults (default 2 if not mentioned)
+    - budget (default 10000 if not mentioned)
+
+    Message: "{message}"
+    **Date Handling Rules (VERY IMPORTANT):**
+    - If the user does **not specify dates**, assume the trip starts **from tomorrow**.
+    - If the user mentions trip duration (like "3 days" or "5-day trip"), calculate `end_date` accordingly.
+    -Output all dates in `YYYY-MM-DD` format.
+    
+    Respond in pure JSON like this:
+    {{
+      "from_city": "...",
+      "to_city": "...",
+      "start_date": "YYYY-MM-DD",
+      "end_date": "YYYY-MM-DD",
+      "adults": ,
+      "budget": 
+    }}
+    """
+
+
+def _parse_extraction(raw_output):
+    raw_output = raw_output.strip()
+
+    # Handle code block formatting
+    if raw_output.startswith("```"):
+        raw_output = raw_output.strip("`")
+        if raw_output.lower().startswith("json"):
+            raw_output = raw_output[4:]
+        raw_output = raw_output.strip()
+
+    try:
+        return json.loads(raw_output)
+    except json.JSONDecodeError as e:
+        print("Invalid JSON output:", raw_output)
+        raise TripExtractionError(str(e), raw_output)
+
+
+def _extraction_llm():
+    return get_llm("gemini-2.0-flash", temperature=0.2)
+
+
+def _rule_based_details(message):
+    details, confidence = parse_trip_message(message)
+    if confidence >= EXTRACTION_MIN_CONFIDENCE:
+        print(f"[INFO] Trip details extracted by rules (confidence {confidence})")
+        return details
+    return None
+
+
+@timed("extraction")
+def extract_trip_details(message):
+    """
+    Pull from_city, to_city, dates, adults and budget out of a chat message.
+    Formulaic messages are parsed locally; the LLM is only asked when the rules aren't confident.
+    """
+    details = _rule_based_details(message)
+    if details:
+        return details
+    extraction_response = _extraction_llm().invoke(_extraction_prompt(message))
+    return _parse_extraction(extraction_response.content)
+
+
+@timed("extraction")
+async def aextract_trip_details(message):
+    """Async counterpart of extract_trip_details"""
+    details = _rule_based_details(message)
+    if details:
+        return details
+    extraction_response = await _extraction_llm().ainvoke(_extraction_prompt(message))
+    return _parse_extraction(extraction_response.content)
+
+
+def build_trip_prompt(details, prefetched, for_agent=True):
+    """
+    Itinerary prompt for the extracted trip, with the prefetched tool data embedded.
+    `for_agent=False` words the closing instructions for a plain (non-ReAct) generation call.
+    """
+    from_city = details.get("from_city")
+    to_city = details.get("to_city")
+    start_date = details.get("start_date")
+    end_date = details.get("end_date")
+    adults = details.get("adults")
+    budget = details.get("budget")
+    answer = "your Final Answer" if for_agent else "your answer"
+
+    prompt = f"""
+You are a trip-mitra an expert travel planner creating a complete itinerary from {from_city} to {to_city}.
+
+Trip Details:
+- Travel Dates: {start_date} to {end_date}
+- Travelers: {adults} adults
+- Budget: ₹{budget}
+
+IMPORTANT INSTRUCTIONS:
+1. The data from all tools (get_trains, get_flights, get_hotels, get_weather_forecast) has ALREADY been collected for you under COLLECTED DATA at the end of this message
+2. DO NOT call any tools - go straight to {answer} using the collected data
+3. DO NOT ask follow-up questions
+4. If a tool's data shows a failure, note it and continue with the other data
+YOUR TASK: Create a comprehensive travel plan with the following sections:
+
+
+TRANSPORTATION :
+### Trains:
+- Use the get_trains data from COLLECTED DATA
+- This contains BOTH outbound and return journey trains
+- If it includes a daily_summary and the travel dates have few or no good trains, suggest a nearby date that does
+- From the results, recommend:
+  * Top 3 trains for outbound journey ({from_city} → {to_city} on {start_date})
+  * Top 3 trains for return journey ({to_city} → {from_city} on {end_date})
+- Selection criteria: Prefer overnight trains (saves daytime for activities), shorter duration, good class availability
+- For each train provide: Name, Number, Departure time, Arrival time, Duration, Available classes
+- If tool fails: Display "Train data unavailable due to API limit" and continue with other sections
+
+### Flights:(Call only if budget is >10,000)
+- Use the get_flights data from COLLECTED DATA
+- This contains flights for complete round trip (every airport serving each city, cheapest fare per airline)
+- If it includes a fare_matrix, mention when shifting the travel dates by a day or two would be noticeably cheaper
+- From the results, recommend:
+  * Top 3 flight options considering both outbound and return
+- Selection criteria: Lowest total cost, minimum stops, convenient timings
+- For each flight provide: Airline name, Flight code(if available), Departure time, Arrival time, Total cost, Class.
+-DO NOT write 'Not available' - if data is missing from API, skip that flight information.
+- If tool fails: Display "Flight data unavailable due to API limit" and continue with other sections
+
+
+ACCOMMODATION :
+
+- Use the get_hotels data from COLLECTED DATA
+- This contains the best-scoring hotels in {to_city}, already ranked by price vs. budget, reviews, star class and distance to the city centre (highest "score" first)
+- From the results, recommend TOP 3 hotels based on:
+  * Budget-friendly (fits within ₹{budget} for {adults} people)
+  * High ratings and positive reviews
+  * Strategic location (close to most attractions in your itinerary - see nearby_attractions and their distance_km)
+  * Good cleanliness and service ratings
+- For each hotel provide:
+  * Hotel name
+  * Brief description (2-3 sentences)
+  * Price per night (approximate)
+  * Nearby landmark from the hotel's nearby_attractions (e.g., "500m from Kashi Vishwanath Temple")
+  * Photo link (from the API response)
+- If tool fails: Display "Hotel data unavailable due to API limit" and continue with other sections
+
+
+DAY-WISE ITINERARY:
+
+For each day of the trip, create a detailed plan:
+
+### Day X Format:
+**Weather:** [Insert weather info here - see weather guidelines below]
+
+**Morning (6 AM - 12 PM):**
+- Place 1: [Name] ([Time needed], [Timings: e.g., 8 AM - 10 AM])
+- Place 2: [Name] ([Time needed], [Timings])
+
+**Afternoon (12 PM - 5 PM):**
+- Place 3: [Name] ([Time needed], [Timings])
+- Lunch recommendation
+
+**Evening (5 PM - 9 PM):**
+- Place 4: [Name] ([Time needed], [Timings])
+- Dinner recommendation
+
+**Local Transportation for the day:**
+[Suggest best local transport options: auto, cab, metro, bus, walking, etc.]
+
+### Weather Guidelines:
+- Use the get_weather_forecast data from COLLECTED DATA for the entire trip
+- **Day 1:** Provide complete weather summary
+  * Temperature range (e.g., "22°C to 30°C")
+  * Humidity level
+  * Rain probability
+  * For hill stations ONLY: Sunrise and sunset times
+  * Example: "Pleasant weather with temperatures between 22-30°C, low humidity (40%), no rain expected"
+- **Day 2 onwards:**
+  * If weather is same/similar: Write "Weather similar to Day 1"
+  * If weather changes significantly: Mention only the changes (e.g., "Light rain expected in afternoon, carry umbrella")
+- **IMPORTANT:** Add weather info WITHIN each day's section, NOT as a separate section
+- If tool fails: Display "Weather data unavailable due to API limit" and continue
+
+
+PACKING LIST:
+
+Create a practical packing checklist based on:
+- Weather conditions during travel dates
+- Activities planned in the itinerary
+- Duration of trip
+- Type of destinations (urban, hill station, beach, religious, etc.)
+
+Group items into categories: Clothing, Documents, Toiletries, Electronics, Medicines, Miscellaneous
+
+
+
+## SECTION 5: ESTIMATED COST BREAKDOWN
+
+Provide a detailed budget breakdown:
+- Train/Flight tickets (both ways): ₹____
+- Accommodation (per night × nights): ₹____
+- Local transportation (daily estimate × days): ₹____
+- Food (breakfast, lunch, dinner × days): ₹____
+- Entry fees for attractions: ₹____
+- Shopping/Miscellaneous (10-15% buffer): ₹____
+**TOTAL ESTIMATED COST:** ₹____
+
+Compare with budget: ₹{budget}
+[Mention if within budget or suggest adjustments]
+
+
+
+FORMATTING REQUIREMENTS:
+✓ Use markdown formatting for clear readability
+✓ Use headers (##, ###), bullet points, and bold text appropriately
+✓ Keep descriptions concise - no unnecessary verbosity
+✓ If ANY tool fails, continue creating the itinerary with available data
+✓ NEVER stop execution midway - always deliver a complete plan
+
+CRITICAL RULE: Even if 1 or 2 tools fail, you MUST still generate a complete itinerary using whatever data is available. A partial plan is better than no plan.
+COMPLETION CHECKLIST (for your internal use):
+□ Used get_trains data (or noted failure)
+□ Used get_flights data (or noted failure)
+□ Used get_hotels data (or noted failure)
+□ Used get_weather_forecast data (or noted failure)
+□ Created day-wise itinerary
+□ Added packing list
+□ Added cost breakdown
+
+Once you have completed the above checklist, immediately provide {answer} with the complete itinerary in markdown format. Do not ask for more information or try to use tools.
+
+COLLECTED DATA:
+
+{format_prefetched_data(prefetched)}
+"""
+    return prompt
+
+
+def resolve_planner_mode(requested=None):
+    """
+    The planner mode for a request: its own `mode` if given, else PLANNER_MODE.
+    Raises ValueError for unknown modes and for a `mode` that isn't a string.
+    """
+    if requested is not None and not isinstance(requested, str):
+        raise ValueError(f"Planner mode must be a string, got {type(requested).__name__}")
+    mode = (requested or PLANNER_MODE).strip().lower()
+    if mode not in PLANNER_MODES:
+        raise ValueError(f"Unknown planner mode '{mode}', expected one of: {', '.join(PLANNER_MODES)}")
+    return mode
+
+
+@timed("planning")
+def generate_itinerary(details, prefetched, mode):
+    """Writes the markdown itinerary from the prefetched tool data using the given planner mode"""
+    if mode == "single_pass":
+        return get_planner_llm().invoke(build_trip_prompt(details, prefetched, for_agent=False)).content
+    with bind_trip(details, prefetched):
+        return get_agent().run(build_trip_prompt(details, prefetched))
+
+
+@timed("planning")
+async def agenerate_itinerary(details, prefetched, mode):
+    """Async counterpart of generate_itinerary"""
+    if mode == "single_pass":
+        response = await get_planner_llm().ainvoke(build_trip_prompt(details, prefetched, for_agent=False))
+        return response.content
+    with bind_trip(details, prefetched):
+        return await get_agent().arun(build_trip_prompt(details, prefetched))
@@ -0,0 +1,216 @@
+import io
+import os
+import re
+import tempfile
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+SARVAM_API_KEY = os.getenv("STT_API_KEY")
+if not SARVAM_API_KEY:
+    raise ValueError("SARVAM_API_KEY not found in .env file")
+
+STT_MODEL = "saaras:v2.5"
+# Overridable so benchmarks and tests can point the client at a local stand-in
+SARVAM_API_BASE_URL = os.getenv("SARVAM_API_BASE_URL", "")
+
+# Uploads are buffered in memory and only spill to a temp file above this size
+VOICE_SPOOL_MAX_BYTES = int(os.getenv("VOICE_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+# Recordings longer than this are split and the pieces transcribed concurrently (needs pydub + ffmpeg)
+VOICE_CHUNK_SECONDS = float(os.getenv("VOICE_CHUNK_SECONDS", "25"))
+VOICE_MAX_PARALLEL = int(os.getenv("VOICE_MAX_PARALLEL", "4"))
+# Lowest bitrate a compressed recording plausibly has (16 kbps): smaller uploads can't be longer than
+# one chunk, so they are sent as they are without being decoded
+VOICE_MIN_BYTES_PER_SECOND = int(os.getenv("VOICE_MIN_BYTES_PER_SECOND", "2000"))
+# Each cut goes in the longest pause within the last VOICE_PAUSE_SEARCH_SECONDS of a chunk; without
+# a pause the next chunk starts VOICE_CHUNK_OVERLAP_SECONDS early and the repeated words are dropped
+VOICE_PAUSE_SEARCH_SECONDS = float(os.getenv("VOICE_PAUSE_SEARCH_SECONDS", "5"))
+VOICE_MIN_PAUSE_MS = int(os.getenv("VOICE_MIN_PAUSE_MS", "300"))
+VOICE_CHUNK_OVERLAP_SECONDS = float(os.getenv("VOICE_CHUNK_OVERLAP_SECONDS", "1.5"))
+
+chunk_executor = ThreadPoolExecutor(max_workers=VOICE_MAX_PARALLEL, thread_name_prefix="stt")
+
+_sarvam_client = None
+_client_lock = threading.Lock()
+
+
+def get_sarvam_client():
+    """The Sarvam AI client, created (and its SDK imported) on the first transcription"""
+    global _sarvam_client
+    if _sarvam_client is None:
+        with _client_lock:
+            if _sarvam_client is None:
+                from sarvamai import SarvamAI
+                from sarvamai.environment import SarvamAIEnvironment
+
+                options = {}
+                if SARVAM_API_BASE_URL:
+                    options["environment"] = SarvamAIEnvironment(
+                        base=SARVAM_API_BASE_URL,
+                        creative=f"{SARVAM_API_BASE_URL}/dubbing",
+                        production=SARVAM_API_BASE_URL.replace("http", "ws", 1),
+                    )
+                _sarvam_client = SarvamAI(api_subscription_key=SARVAM_API_KEY, **options)
+    return _sarvam_client
+
+
+def transcribe(file):
+    """
+    Translates speech to English text with Sarvam AI.
+    `file` is a binary file object or a (filename, bytes, content_type) tuple.
+    """
+    response = get_sarvam_client().speech_to_text.translate(
+        file=file,
+        model=STT_MODEL
+    )
+
+    # Check if response has transcript
+    if hasattr(response, 'transcript') and response.transcript:
+        return response.transcript
+    # Response might have different structure
+    return str(response)
+
+
+def spool_upload(stream, chunk_size=64 * 1024):
+    """
+    Copies an upload stream into a SpooledTemporaryFile (memory up to VOICE_SPOOL_MAX_BYTES)
+    and returns it rewound. The caller closes it.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=VOICE_SPOOL_MAX_BYTES)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+
+def _upper_bound_seconds(file, filename):
+    """
+    The longest the recording can be, from its WAV header or else its size, without decoding it.
+    None when there is no cheap answer.
+    """
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    if (filename or "").lower().endswith(".wav"):
+        try:
+            with wave.open(file) as f:
+                return f.getnframes() / float(f.getframerate())
+        except (wave.Error, EOFError, ZeroDivisionError):
+            pass
+        finally:
+            file.seek(0)
+    return size / VOICE_MIN_BYTES_PER_SECOND if VOICE_MIN_BYTES_PER_SECOND else None
+
+
+def _chunk_bounds(audio, chunk_ms):
+    """
+    (start_ms, end_ms, overlaps_previous) of each chunk. A chunk ends in the longest pause near
+    its end, or, if there is none, runs the full length and the next one starts a little earlier.
+    """
+    from pydub.silence import detect_silence
+
+    search_ms = min(int(VOICE_PAUSE_SEARCH_SECONDS * 1000), chunk_ms // 2)
+    overlap_ms = min(int(VOICE_CHUNK_OVERLAP_SECONDS * 1000), chunk_ms // 2)
+    # Pauses are judged relative to the recording's own loudness
+    threshold = audio.dBFS - 16 if audio.dBFS != float("-inf") else -60
+
+    bounds = []
+    start, overlapped = 0, False
+    while len(audio) - start > chunk_ms:
+        end = start + chunk_ms
+        window_start = end - search_ms
+        pauses = detect_silence(
+            audio[window_start:end], min_silence_len=VOICE_MIN_PAUSE_MS, silence_thresh=threshold, seek_step=10
+        )
+        if pauses:
+            pause_start, pause_end = max(pauses, key=lambda pause: pause[1] - pause[0])
+            cut = window_start + (pause_start + pause_end) // 2
+            bounds.append((start, cut, overlapped))
+            start, overlapped = cut, False
+        else:
+            bounds.append((start, end, overlapped))
+            start, overlapped = end - overlap_ms, True
+    bounds.append((start, len(audio), overlapped))
+    return bounds
+
+
+def split_audio(file, filename, chunk_seconds=VOICE_CHUNK_SECONDS):
+    """
+    Splits a recording into in-memory WAV chunks of at most `chunk_seconds`, cut at pauses where possible.
+    Returns [(chunk, overlaps_previous)], or None when it doesn't need splitting or can't be decoded
+    (pydub or ffmpeg missing). Only recordings that may be longer than one chunk are decoded.
+    """
+    upper_bound = _upper_bound_seconds(file, filename)
+    if upper_bound is not None and upper_bound <= chunk_seconds:
+        return None
+
+    try:
+        from pydub import AudioSegment
+    except ImportError:
+        return None
+
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower() or None
+    try:
+        audio = AudioSegment.from_file(file, format=extension)
+    except Exception as e:
+        print(f"[WARNING] Could not decode audio for chunking: {e}")
+        return None
+    finally:
+        file.seek(0)
+
+    chunk_ms = int(chunk_seconds * 1000)
+    if len(audio) <= chunk_ms:
+        return None
+
+    # 16 kHz mono is all speech recognition needs and keeps each upload small
+    audio = audio.set_frame_rate(16000).set_channels(1)
+    chunks = []
+    for start, end, overlapped in _chunk_bounds(audio, chunk_ms):
+        chunk = io.BytesIO()
+        audio[start:end].export(chunk, format="wav")
+        chunk.seek(0)
+        chunks.append((chunk, overlapped))
+    return chunks
+
+
+def _word_key(word):
+    return re.sub(r"\W+", "", word.lower())
+
+
+def join_transcripts(texts, overlaps, max_overlap_words=8):
+    """
+    Joins chunk transcripts in order. Where a chunk overlaps the previous one, the words both
+    transcripts share at the seam are kept once.
+    """
+    words = []
+    for text, overlapped in zip(texts, overlaps):
+        current = (text or "").split()
+        if overlapped and words:
+            keys = [_word_key(word) for word in current]
+            for n in range(min(max_overlap_words, len(words), len(current)), 0, -1):
+                if [_word_key(word) for word in words[-n:]] == keys[:n]:
+                    current = current[n:]
+                    break
+        words.extend(current)
+    return " ".join(words)
+
+
+def transcribe_recording(file, filename="audio.webm", content_type=None):
+    """
+    Transcribes an uploaded recording held in a (spooled) file object.
+    Long recordings are transcribed chunk by chunk in parallel and the transcripts joined in order.
+    """
+    chunks = split_audio(file, filename)
+    if not chunks:
+        return transcribe((filename, file, content_type))
+
+    texts = chunk_executor.map(
+        lambda item: transcribe((f"chunk_{item[0]}.wav", item[1][0], "audio/wav")),
+        enumerate(chunks),
+    )
+    return join_transcripts(list(texts), [overlapped for _, overlapped in chunks])
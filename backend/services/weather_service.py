@@ -1,91 +1,290 @@
-import requests
+import asyncio
+import functools
+import threading
+import time
 import urllib.parse
 import pytz
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 import os
 from dotenv import load_dotenv
+
+try:
+    from services import http_client
+    from services.cache import CACHE_TTLS, cached, make_key, response_cache
+    from services.code_index import normalize
+    from services.single_flight import single_flight
+    from services.metrics import timed
+    from services.quota import QuotaError, degraded_result
+    from services.geocode import get_coordinates
+except ImportError:
+    import http_client
+    from cache import CACHE_TTLS, cached, make_key, response_cache
+    from code_index import normalize
+    from single_flight import single_flight
+    from metrics import timed
+    from quota import QuotaError, degraded_result
+    from geocode import get_coordinates
+
 load_dotenv()
 WEATHER_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Overridable so benchmarks and tests can point the service at local stand-ins
+PLACES_API_BASE_URL = os.getenv("PLACES_API_BASE_URL", "https://maps.googleapis.com")
+WEATHER_API_BASE_URL = os.getenv("WEATHER_API_BASE_URL", "https://weather.googleapis.com")
+# Days the forecast endpoint returns, starting today
+FORECAST_DAYS = 10
+WEATHER_STORE_MAX_DESTINATIONS = int(os.getenv("WEATHER_STORE_MAX_DESTINATIONS", "512"))
 
-def get_maps_places(location, search_text="Most Popular places in "):
+def search_places(location, search_text="Most Popular places in "):
+    """
+    Places text search; returns every result (name, geometry, rating, ...).
+    """
     search_query = search_text + location
     search_url = (
-        "https://maps.googleapis.com/maps/api/place/textsearch/json?query="
+        f"{PLACES_API_BASE_URL}/maps/api/place/textsearch/json?query="
         + urllib.parse.quote(search_query)
         + f"&radius=20000&key={WEATHER_API_KEY}"
     )
 
-    response = requests.get(search_url)
+    response = http_client.get(search_url, quota=("google", WEATHER_API_KEY))
     if response.status_code != 200:
         raise Exception(f"Failed to fetch place info: {response.status_code}")
 
     data = response.json()
     if "results" not in data or not data["results"]:
         raise Exception("No places found for the location.")
-    return data["results"][0]["geometry"]["location"]
+    return data["results"]
 
 
-def get_weather(destination):
-    loc = get_maps_places(destination)
-    url = (
-        f"https://weather.googleapis.com/v1/forecast/days:lookup?"
-        f"key={WEATHER_API_KEY}&location.latitude={loc['lat']}&location.longitude={loc['lng']}&days=10"
-    )
-    response = requests.get(url)
+def get_maps_places(location, search_text="Most Popular places in "):
+    return search_places(location, search_text)[0]["geometry"]["location"]
+
+
+def _forecast_request(loc):
+    """Keyword arguments for http_client.get/aget"""
+    return {
+        "url": (
+            f"{WEATHER_API_BASE_URL}/v1/forecast/days:lookup?"
+            f"key={WEATHER_API_KEY}&location.latitude={loc['lat']}&location.longitude={loc['lng']}&days={FORECAST_DAYS}"
+        ),
+        "quota": ("google", WEATHER_API_KEY),
+    }
+
+
+def _forecast_result(response):
     if response.status_code != 200:
         raise Exception(f"Weather API failed: {response.status_code}")
-    return response.json()
+    return {**response.json(), "fetchedAt": time.time()}
 
 
-def parse_weather_data(destination, start_date, end_date):
-    data = get_weather(destination)
-    forecast_days = data.get("forecastDays", [])
-    tz_info = pytz.timezone(data["timeZone"]["id"])
-
-    start = datetime.strptime(start_date, "%Y-%m-%d").date()
-    end = datetime.strptime(end_date, "%Y-%m-%d").date()
-
-    forecast_map = {
-        datetime(
-            year=day["displayDate"]["year"],
-            month=day["displayDate"]["month"],
-            day=day["displayDate"]["day"],
-        ).date(): day
-        for day in forecast_days
+def _fetch_weather(destination):
+    return _forecast_result(http_client.get(**_forecast_request(get_coordinates(destination))))
+
+
+async def _afetch_weather(destination):
+    # Coordinates almost always come from the local geocode store, so this rarely blocks
+    loc = await asyncio.to_thread(get_coordinates, destination)
+    return _forecast_result(await http_client.aget(**_forecast_request(loc)))
+
+
+@single_flight()
+@cached("weather")
+def get_weather(destination):
+    return _fetch_weather(destination)
+
+
+@single_flight(endpoint="weather_service.get_weather")
+@cached("weather", endpoint="weather_service.get_weather")
+async def async_get_weather(destination):
+    return await _afetch_weather(destination)
+
+
+def _replace_cached_weather(destination, data):
+    response_cache.set(make_key("weather_service.get_weather", destination), data, CACHE_TTLS["weather"], "weather")
+    return data
+
+
+@single_flight()
+def refresh_weather(destination):
+    """Fetches a new forecast, replacing the cached one"""
+    return _replace_cached_weather(destination, _fetch_weather(destination))
+
+
+@single_flight(endpoint="weather_service.refresh_weather")
+async def async_refresh_weather(destination):
+    return _replace_cached_weather(destination, await _afetch_weather(destination))
+
+
+@functools.lru_cache(maxsize=None)
+def _timezone(tz_id):
+    return pytz.timezone(tz_id)
+
+
+def _local_time(timestamp, tz_info):
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).astimezone(tz_info).strftime("%I:%M %p")
+
+
+def _parse_day(day, tz_info):
+    df, nf, sun = day["daytimeForecast"], day["nighttimeForecast"], day["sunEvents"]
+    return {
+        "condition_day": df["weatherCondition"]["description"]["text"],
+        "condition_night": nf["weatherCondition"]["description"]["text"],
+        "max_temp": day["maxTemperature"]["degrees"],
+        "min_temp": day["minTemperature"]["degrees"],
+        "humidity_day": df["relativeHumidity"],
+        "humidity_night": nf["relativeHumidity"],
+        "rain_chance": df["precipitation"]["probability"]["percent"],
+        "sunrise": _local_time(sun["sunriseTime"], tz_info),
+        "sunset": _local_time(sun["sunsetTime"], tz_info),
     }
 
+
+class Forecast:
+    """A destination's forecast window, parsed once into per-day records"""
+
+    def __init__(self, data):
+        self.fetched_at = data.get("fetchedAt", time.time())
+        self.tz_info = _timezone(data["timeZone"]["id"])
+        self.days = {}
+        for day in data.get("forecastDays", []):
+            display = day["displayDate"]
+            try:
+                record = _parse_day(day, self.tz_info)
+            except KeyError:
+                continue
+            self.days[date(display["year"], display["month"], display["day"])] = record
+        self.first = min(self.days, default=None)
+        self.last = max(self.days, default=None)
+
+    def is_fresh(self):
+        return time.time() - self.fetched_at < CACHE_TTLS["weather"]
+
+    def today(self):
+        """Today at the destination, which is where the provider's forecast window starts"""
+        return datetime.now(self.tz_info).date()
+
+    def covers(self, start, end):
+        """
+        True if the forecast has every day of start..end that a new fetch would return. That window
+        starts today at the destination and is as long as what the provider actually sent last time,
+        so a provider returning fewer than FORECAST_DAYS days doesn't cause a refetch on every call.
+        """
+        if self.first is None:
+            # Nothing came back; asking again before the forecast goes stale won't help
+            return True
+        anchor = max(self.today(), self.first)
+        first = max(start, anchor)
+        last = min(end, anchor + timedelta(days=len(self.days) - 1))
+        return first > last or (self.first <= first and last <= self.last)
+
+
+def _in_horizon(start, end):
+    """
+    False if no forecast fetched now can cover any of start..end. The server's date is a day off
+    the destination's near midnight, so a day of slack is allowed on both sides.
+    """
+    today = date.today()
+    return start <= today + timedelta(days=FORECAST_DAYS) and end >= today - timedelta(days=1)
+
+
+class ForecastStore:
+    """
+    Per-destination forecasts kept in memory, so any date sub-range is served from one fetch.
+    A destination is refetched only when its forecast is stale or no longer covers the requested dates.
+    """
+
+    def __init__(self, max_destinations=WEATHER_STORE_MAX_DESTINATIONS):
+        self.max_destinations = max_destinations
+        self._forecasts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, destination):
+        with self._lock:
+            forecast = self._forecasts.get(normalize(destination))
+            if forecast is not None:
+                self._forecasts.move_to_end(normalize(destination))
+            return forecast
+
+    def put(self, destination, data):
+        forecast = Forecast(data)
+        with self._lock:
+            self._forecasts[normalize(destination)] = forecast
+            self._forecasts.move_to_end(normalize(destination))
+            while len(self._forecasts) > self.max_destinations:
+                self._forecasts.popitem(last=False)
+        return forecast
+
+    @staticmethod
+    def usable(forecast, start, end):
+        return forecast is not None and forecast.is_fresh() and forecast.covers(start, end)
+
+    def _usable_or_none(self, forecast, start, end):
+        return forecast if self.usable(forecast, start, end) else None
+
+    def _keep(self, destination, data, start, end):
+        """Stores a fetched forecast; returns it if it covers start..end, else None"""
+        return self._usable_or_none(self.put(destination, data), start, end)
+
+    def forecast(self, destination, start, end):
+        # The shared response cache may hold a forecast another worker fetched; refetch only if it won't do
+        forecast = (
+            self._usable_or_none(self.get(destination), start, end)
+            or self._keep(destination, get_weather(destination), start, end)
+        )
+        return forecast or self.put(destination, refresh_weather(destination))
+
+    async def aforecast(self, destination, start, end):
+        forecast = (
+            self._usable_or_none(self.get(destination), start, end)
+            or self._keep(destination, await async_get_weather(destination), start, end)
+        )
+        return forecast or self.put(destination, await async_refresh_weather(destination))
+
+
+forecast_store = ForecastStore()
+
+
+def _weather_for_dates(forecast, start, end):
     result = {}
-    day_counter = 1
     current = start
-
+    day_counter = 1
     while current <= end:
-        key = f"Day {day_counter}"
-        if current in forecast_map:
-            day = forecast_map[current]
-            df, nf, sun = day["daytimeForecast"], day["nighttimeForecast"], day["sunEvents"]
-            result[key] = {
-                "condition_day": df["weatherCondition"]["description"]["text"],
-                "condition_night": nf["weatherCondition"]["description"]["text"],
-                "max_temp": day["maxTemperature"]["degrees"],
-                "min_temp": day["minTemperature"]["degrees"],
-                "humidity_day": df["relativeHumidity"],
-                "humidity_night": nf["relativeHumidity"],
-                "rain_chance": df["precipitation"]["probability"]["percent"],
-                "sunrise": datetime.fromisoformat(sun["sunriseTime"].replace("Z", "+00:00"))
-                .astimezone(tz_info)
-                .strftime("%I:%M %p"),
-                "sunset": datetime.fromisoformat(sun["sunsetTime"].replace("Z", "+00:00"))
-                .astimezone(tz_info)
-                .strftime("%I:%M %p"),
-            }
-        else:
-            result[key] = "Weather data not available for this day"
-
+        record = forecast.days.get(current) if forecast else None
+        result[f"Day {day_counter}"] = dict(record) if record else "Weather data not available for this day"
         current += timedelta(days=1)
         day_counter += 1
-
     return result
 
+
+def _parse_dates(start_date, end_date):
+    return (
+        datetime.strptime(start_date, "%Y-%m-%d").date(),
+        datetime.strptime(end_date, "%Y-%m-%d").date(),
+    )
+
+
+@timed("service.weather")
+@single_flight()
+def parse_weather_data(destination, start_date, end_date):
+    start, end = _parse_dates(start_date, end_date)
+    # Dates entirely outside the forecast horizon need no fetch at all
+    try:
+        forecast = forecast_store.forecast(destination, start, end) if _in_horizon(start, end) else None
+    except QuotaError as e:
+        return degraded_result(e)
+    return _weather_for_dates(forecast, start, end)
+
+
+@timed("service.weather")
+@single_flight(endpoint="weather_service.parse_weather_data")
+async def async_parse_weather_data(destination, start_date, end_date):
+    start, end = _parse_dates(start_date, end_date)
+    try:
+        forecast = await forecast_store.aforecast(destination, start, end) if _in_horizon(start, end) else None
+    except QuotaError as e:
+        return degraded_result(e)
+    return _weather_for_dates(forecast, start, end)
+
 # if __name__ == "__main__":
 #     print("=== WEATHER API TEST STARTED ===")
 #
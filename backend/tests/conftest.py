@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The services import as `services.<name>` from the backend directory, as app.py and asgi.py do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep tests off the shared on-disk cache and quota files, and let modules that require keys import
+os.environ.setdefault("CACHE_DB_PATH", "")
+os.environ.setdefault("QUOTA_DB_PATH", "")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("STT_API_KEY", "test")
@@ -0,0 +1,41 @@
+from datetime import date
+
+import pytest
+
+from services.trip_parser import DEFAULT_BUDGET, parse_trip_message
+from services.trip_planner import EXTRACTION_MIN_CONFIDENCE
+
+TODAY = date(2025, 11, 3)
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Delhi to Goa 3 days 2 adults budget 20000",
+     {"from_city": "Delhi", "to_city": "Goa", "start_date": "2025-11-04", "end_date": "2025-11-06",
+      "adults": 2, "budget": 20000}),
+    ("Delhi to Goa 3 days budget rs. 15k", {"budget": 15000}),
+    ("Mumbai to Goa 4 days under 30000", {"budget": 30000, "end_date": "2025-11-07"}),
+    ("Delhi to Goa 3 days 2 adults rs5000", {"budget": 5000}),
+    ("Delhi to Goa on 12/11 for 3 days budget 2 lakhs",
+     {"start_date": "2025-11-12", "end_date": "2025-11-14", "budget": 200000}),
+    # "hours" ends in "rs" but is no currency: the duration stays and the budget is the default
+    ("Delhi to Goa stay 3 hours 5 days", {"end_date": "2025-11-08", "budget": DEFAULT_BUDGET}),
+])
+def test_confident_parses(message, expected):
+    details, confidence = parse_trip_message(message, today=TODAY)
+    assert confidence >= EXTRACTION_MIN_CONFIDENCE
+    assert {key: details[key] for key in expected} == expected
+
+
+@pytest.mark.parametrize("message", [
+    # A bare amount could be the budget; the rules must not swap in DEFAULT_BUDGET confidently
+    "Delhi to Jaipur 2 days 2 adults 25000",
+    "trip to goa from delhi 3 days 15000",
+    # Nightly and per-person rates aren't the trip budget
+    "Delhi to Goa 3 days 2 adults hotel under 5000 per night",
+    "Delhi to Goa 3 days ₹5000 per person",
+    "Delhi to Goa 3 days 2 adults 8000/- per night",
+])
+def test_unread_amounts_go_to_the_llm(message):
+    details, confidence = parse_trip_message(message, today=TODAY)
+    assert confidence < EXTRACTION_MIN_CONFIDENCE
+    assert details["budget"] == DEFAULT_BUDGET
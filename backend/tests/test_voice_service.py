@@ -0,0 +1,90 @@
+import io
+import wave
+
+import pytest
+
+from services import voice_service
+from services.voice_service import _upper_bound_seconds, join_transcripts
+
+
+def _wav_bytes(seconds, rate=8000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("texts, overlaps, expected", [
+    (["hello there", "general kenobi"], [False, False], "hello there general kenobi"),
+    # The overlapping chunk repeats the seam's words; they are kept once, ignoring case and punctuation
+    (["we want to go to goa", "Go to Goa, next week"], [False, True], "we want to go to goa next week"),
+    (["book a hotel near", "near the beach", "beach please"], [False, True, True], "book a hotel near the beach please"),
+    # Without an overlap, repeated words are what was said
+    (["go go", "go now"], [False, False], "go go go now"),
+    (["", "only this"], [False, True], "only this"),
+])
+def test_join_transcripts(texts, overlaps, expected):
+    assert join_transcripts(texts, overlaps) == expected
+
+
+def test_upper_bound_reads_the_wav_header():
+    file = io.BytesIO(_wav_bytes(3.5))
+    assert _upper_bound_seconds(file, "clip.wav") == pytest.approx(3.5)
+    assert file.tell() == 0
+
+
+@pytest.mark.parametrize("filename, data", [
+    ("clip.webm", b"\x1a" * 10000),
+    # A .wav that isn't one falls back to the size as well
+    ("broken.wav", b"not a wav" * 1000),
+])
+def test_upper_bound_from_size(filename, data):
+    file = io.BytesIO(data)
+    assert _upper_bound_seconds(file, filename) == len(data) / voice_service.VOICE_MIN_BYTES_PER_SECOND
+    assert file.tell() == 0
+
+
+def test_short_uploads_are_not_decoded():
+    assert voice_service.split_audio(io.BytesIO(_wav_bytes(2)), "clip.wav", chunk_seconds=25) is None
+
+
+def _speech(seconds):
+    from pydub.generators import Sine
+
+    return Sine(440, sample_rate=8000).to_audio_segment(duration=int(seconds * 1000))
+
+
+def test_chunks_are_cut_at_a_pause():
+    pytest.importorskip("pydub")
+    from pydub import AudioSegment
+
+    audio = _speech(21) + AudioSegment.silent(duration=600, frame_rate=8000) + _speech(20)
+    bounds = voice_service._chunk_bounds(audio, 25000)
+    assert len(bounds) == 2
+    (first_start, cut, first_overlap), (second_start, end, second_overlap) = bounds
+    assert (first_start, first_overlap, second_overlap) == (0, False, False)
+    assert 21000 <= cut <= 21600 and second_start == cut and end == len(audio)
+
+
+def test_chunks_overlap_without_a_pause():
+    pytest.importorskip("pydub")
+    audio = _speech(60)
+    overlap_ms = int(voice_service.VOICE_CHUNK_OVERLAP_SECONDS * 1000)
+    assert voice_service._chunk_bounds(audio, 25000) == [
+        (0, 25000, False),
+        (25000 - overlap_ms, 50000 - overlap_ms, True),
+        (50000 - 2 * overlap_ms, 60000, True),
+    ]
+
+
+def test_long_wav_is_split_into_wav_chunks():
+    pytest.importorskip("pydub")
+    file = io.BytesIO()
+    _speech(60).export(file, format="wav")
+    chunks = voice_service.split_audio(file, "clip.wav", chunk_seconds=25)
+    assert [overlapped for _, overlapped in chunks] == [False, True, True]
+    with wave.open(chunks[0][0]) as f:
+        assert f.getframerate() == 16000 and f.getnframes() == 25 * 16000